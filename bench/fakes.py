@@ -0,0 +1,272 @@
+import asyncio
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+class FakeGeminiClient:
+    """
+    Stands in for genai.Client in analyzer: model listing, count_tokens and
+    structured generate_content with configurable latency. Latency scales with
+    prompt size (`per_1k_tokens`) on top of a base plus uniform jitter.
+    aio.batches mimics the inline Batch API (create/get/cancel): a job succeeds
+    `batch_latency` seconds after creation, every `batch_fail_every`-th item
+    comes back with an error, and `batch_stuck` jobs never leave RUNNING.
+    serve_fake_gemini() exposes the same behaviour over the REST API.
+    """
+
+    def __init__(self, latency: float = 0.2, jitter: float = 0.05, per_1k_tokens: float = 0.0,
+                 models=("gemini-2.5-flash",), seed: int = 7, batch_latency: float = 0.1,
+                 batch_fail_every: int = 0, batch_stuck: bool = False):
+        self.latency = latency
+        self.jitter = jitter
+        self.per_1k_tokens = per_1k_tokens
+        self.model_names = list(models)
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self.batch_latency = batch_latency
+        self.batch_fail_every = batch_fail_every
+        self.batch_stuck = batch_stuck
+        self.batch_jobs = {}
+        self.cancelled = []
+        self._lock = threading.Lock()
+        self.models = SimpleNamespace(list=self._list)
+        self.aio = SimpleNamespace(
+            models=SimpleNamespace(
+                generate_content=self._generate_content,
+                count_tokens=self._count_tokens,
+            ),
+            batches=SimpleNamespace(
+                create=self._batch_create,
+                get=self._batch_get,
+                cancel=self._batch_cancel,
+            ),
+        )
+
+    # Backend behaviour, shared by the in-process client and the HTTP stub
+
+    def delay(self, prompt: str) -> float:
+        tokens = math.ceil(len(prompt) / 4)
+        return self.latency + self.rng.uniform(0, self.jitter) + self.per_1k_tokens * tokens / 1000
+
+    def answer(self, prompt: str) -> dict:
+        """One synthetic KnowledgeMine JSON answer: {text, prompt_tokens, output_tokens}."""
+        with self._lock:
+            self.calls += 1
+            calls = self.calls
+        text = json.dumps({
+            "topic": f"Synthetic Insight {calls}",
+            "tags": ["bench", "synthetic"],
+            "problem_context": "Synthetic context. " * 5,
+            "solution_insight": "Synthetic solution. " * 10,
+            "code_snippet": "print('hello')",
+            "blog_post": "### Synthetic\n" + "I measured things. " * 40,
+        })
+        return {"text": text, "prompt_tokens": math.ceil(len(prompt) / 4), "output_tokens": len(text) // 4}
+
+    def submit_batch(self, prompts: list) -> str:
+        """Registers a batch job; each item is an answer dict or None for a failed item."""
+        items = []
+        for i, prompt in enumerate(prompts):
+            if self.batch_fail_every and i % self.batch_fail_every == self.batch_fail_every - 1:
+                items.append(None)
+            else:
+                items.append(self.answer(prompt))
+        with self._lock:
+            name = f"batches/fake-{len(self.batch_jobs) + 1}"
+            self.batch_jobs[name] = {"created": time.monotonic(), "items": items, "state": "PENDING"}
+        return name
+
+    def poll_batch(self, name: str):
+        """(state, items or None) with states PENDING/RUNNING/SUCCEEDED/CANCELLED."""
+        with self._lock:
+            job = self.batch_jobs[name]
+            if job["state"] == "CANCELLED":
+                return job["state"], None
+            if self.batch_stuck or time.monotonic() - job["created"] < self.batch_latency:
+                job["state"] = "RUNNING"
+                return job["state"], None
+            job["state"] = "SUCCEEDED"
+            return job["state"], job["items"]
+
+    def cancel_batch(self, name: str):
+        with self._lock:
+            self.batch_jobs[name]["state"] = "CANCELLED"
+            self.cancelled.append(name)
+
+    # genai.Client surface
+
+    def _list(self):
+        return [SimpleNamespace(name=f"models/{m}", supported_actions=["generateContent"]) for m in self.model_names]
+
+    async def _count_tokens(self, model: str, contents: str):
+        await asyncio.sleep(0.005)
+        return SimpleNamespace(total_tokens=math.ceil(len(contents) / 4))
+
+    @staticmethod
+    def _response(answer: dict):
+        return SimpleNamespace(
+            text=answer["text"],
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=answer["prompt_tokens"], candidates_token_count=answer["output_tokens"],
+            ),
+        )
+
+    async def _generate_content(self, model: str, contents: str, config: dict = None):
+        await asyncio.sleep(self.delay(contents))
+        return self._response(self.answer(contents))
+
+    def _job(self, name: str, state: str, items=None):
+        responses = None
+        if items is not None:
+            responses = [
+                SimpleNamespace(response=None, error={"code": 400, "message": "INVALID_ARGUMENT"}) if item is None
+                else SimpleNamespace(response=self._response(item), error=None)
+                for item in items
+            ]
+        return SimpleNamespace(
+            name=name,
+            state=SimpleNamespace(name=f"JOB_STATE_{state}"),
+            dest=SimpleNamespace(inlined_responses=responses),
+            error=None,
+        )
+
+    async def _batch_create(self, model: str, src: list, config: dict = None):
+        await asyncio.sleep(0.005)
+        name = self.submit_batch([request["contents"][0]["parts"][0]["text"] for request in src])
+        return self._job(name, "PENDING")
+
+    async def _batch_get(self, name: str):
+        await asyncio.sleep(0.005)
+        return self._job(name, *self.poll_batch(name))
+
+    async def _batch_cancel(self, name: str):
+        self.cancel_batch(name)
+
+# REST stub: the Gemini API (v1beta) endpoints analyzer uses, backed by a FakeGeminiClient.
+# Point the real SDK at it with GEMINI_BASE_URL to exercise its request and response shapes.
+
+def _rest_response(answer: dict) -> dict:
+    return {
+        "candidates": [{"content": {"role": "model", "parts": [{"text": answer["text"]}]}, "finishReason": "STOP"}],
+        "usageMetadata": {
+            "promptTokenCount": answer["prompt_tokens"],
+            "candidatesTokenCount": answer["output_tokens"],
+            "totalTokenCount": answer["prompt_tokens"] + answer["output_tokens"],
+        },
+    }
+
+def _error(code: int, message: str) -> dict:
+    return {"error": {"code": code, "message": message, "status": "INVALID_ARGUMENT" if code == 400 else "NOT_FOUND"}}
+
+def _prompt(request: dict) -> str:
+    return "".join(part.get("text", "") for content in request["contents"] for part in content["parts"])
+
+class _GeminiHandler(BaseHTTPRequestHandler):
+    fake: FakeGeminiClient = None
+    ROUTES = (
+        ("GET", re.compile(r"/v1beta/models$"), "_list_models"),
+        ("POST", re.compile(r"/v1beta/models/([^/:]+):generateContent$"), "_generate"),
+        ("POST", re.compile(r"/v1beta/models/([^/:]+):countTokens$"), "_count_tokens"),
+        ("POST", re.compile(r"/v1beta/models/([^/:]+):batchGenerateContent$"), "_create_batch"),
+        ("GET", re.compile(r"/v1beta/(batches/[^/:]+)$"), "_get_batch"),
+        ("POST", re.compile(r"/v1beta/(batches/[^/:]+):cancel$"), "_cancel_batch"),
+    )
+
+    def log_message(self, *args):
+        pass
+
+    def _route(self, method: str):
+        path = self.path.split("?", 1)[0]
+        for route_method, pattern, handler in self.ROUTES:
+            match = pattern.match(path)
+            if route_method == method and match:
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length)) if length else {}
+                try:
+                    status, payload = getattr(self, handler)(body, *match.groups())
+                except (KeyError, IndexError, TypeError) as e:
+                    status, payload = 400, _error(400, f"Malformed request: {e!r}")
+                return self._send(status, payload)
+        self._send(404, _error(404, f"No route for {method} {path}"))
+
+    def _send(self, status: int, payload: dict):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def _list_models(self, body):
+        return 200, {"models": [
+            {"name": f"models/{m}", "supportedGenerationMethods": ["generateContent", "countTokens", "batchGenerateContent"]}
+            for m in self.fake.model_names
+        ]}
+
+    def _generate(self, body, model):
+        prompt = _prompt(body)
+        time.sleep(self.fake.delay(prompt))
+        return 200, _rest_response(self.fake.answer(prompt))
+
+    def _count_tokens(self, body, model):
+        return 200, {"totalTokens": math.ceil(len(_prompt(body)) / 4)}
+
+    def _create_batch(self, body, model):
+        batch = body["batch"]
+        requests = [item["request"] for item in batch["inputConfig"]["requests"]["requests"]]
+        for request in requests:
+            # analyzer._batch_request asks for schema-constrained JSON on every item
+            config = request.get("generationConfig", {})
+            if config.get("responseMimeType") != "application/json" or "responseJsonSchema" not in config:
+                return 400, _error(400, "Batch request without a JSON response schema")
+        name = self.fake.submit_batch([_prompt(r) for r in requests])
+        return 200, self._batch(name, "PENDING", None, batch.get("displayName"), model)
+
+    def _get_batch(self, body, name):
+        if name not in self.fake.batch_jobs:
+            return 404, _error(404, f"{name} not found")
+        return 200, self._batch(name, *self.fake.poll_batch(name))
+
+    def _cancel_batch(self, body, name):
+        if name not in self.fake.batch_jobs:
+            return 404, _error(404, f"{name} not found")
+        self.fake.cancel_batch(name)
+        return 200, {}
+
+    @staticmethod
+    def _batch(name: str, state: str, items, display_name: str = None, model: str = None) -> dict:
+        metadata = {
+            "@type": "type.googleapis.com/google.ai.generativelanguage.v1main.GenerateContentBatch",
+            "name": name,
+            "state": f"BATCH_STATE_{state}",
+        }
+        if display_name:
+            metadata["displayName"] = display_name
+        if model:
+            metadata["model"] = f"models/{model}"
+        if items is not None:
+            metadata["output"] = {"inlinedResponses": {"inlinedResponses": [
+                {"error": {"code": 400, "message": "INVALID_ARGUMENT"}} if item is None
+                else {"response": _rest_response(item)}
+                for item in items
+            ]}}
+        return {"name": name, "metadata": metadata, "done": state in ("SUCCEEDED", "CANCELLED")}
+
+def serve_fake_gemini(fake: FakeGeminiClient, port: int = 0):
+    """Serves the Gemini REST stub on localhost. Returns (server, base_url)."""
+    handler = type("GeminiHandler", (_GeminiHandler,), {"fake": fake})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="bench-gemini", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
@@ -0,0 +1,146 @@
+import json
+import random
+import struct
+import threading
+import zlib
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+WORDS = (
+    "cache latency throughput queue scheduler backoff retry token budget chunk overlap "
+    "browser context scroll selector mutation observer export mapping conversation vault "
+    "note attachment hash hardlink journal stage worker semaphore batch gemini schema"
+).split()
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+def make_conversation(rng: random.Random, index: int, messages: int, words: int = 60) -> dict:
+    """
+    One ChatGPT-export conversation: a root node, a user/assistant chain and an
+    abandoned edit branch every 10 messages, so the DFS walk sees real trees.
+    """
+    mapping = {"root": {"id": "root", "message": None, "parent": None, "children": []}}
+    parent = "root"
+    for m in range(messages):
+        node_id = f"c{index}-m{m}"
+        role = "user" if m % 2 == 0 else "assistant"
+        mapping[node_id] = {
+            "id": node_id,
+            "parent": parent,
+            "children": [],
+            "message": {
+                "author": {"role": role},
+                "create_time": 1700000000 + index * 1000 + m,
+                "content": {"content_type": "text", "parts": [sentence(rng, words)]},
+            },
+        }
+        mapping[parent]["children"].append(node_id)
+        if m % 10 == 5:
+            branch_id = f"{node_id}-edit"
+            mapping[branch_id] = {
+                "id": branch_id, "parent": parent, "children": [],
+                "message": {
+                    "author": {"role": role}, "create_time": 1700000000 + index * 1000 + m,
+                    "content": {"content_type": "text", "parts": [sentence(rng, words // 2)]},
+                },
+            }
+            mapping[parent]["children"].append(branch_id)
+        parent = node_id
+    return {"id": f"conv-{index}", "title": f"Synthetic conversation {index}", "mapping": mapping}
+
+def write_export(path: Path, conversations: int, messages: int, seed: int = 7) -> Path:
+    """Writes a conversations.json with the given shape, one conversation at a time."""
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[")
+        for i in range(conversations):
+            if i:
+                f.write(",\n")
+            f.write(json.dumps(make_conversation(rng, i, messages)))
+        f.write("]")
+    return path
+
+def write_chat_log(path: Path, messages: int, seed: int = 7, words: int = 80) -> Path:
+    """A plain pasted chat log (User:/Assistant: turns), the watcher's most common input."""
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        for m in range(messages):
+            f.write(f"{'User' if m % 2 == 0 else 'Assistant'}: {sentence(rng, words)}\n\n")
+    return path
+
+def png_bytes(width: int, height: int, seed: int) -> bytes:
+    """A valid RGB PNG of noise (incompressible, so it clears the tracking-pixel filters)."""
+    rng = random.Random(seed)
+    raw = b"".join(b"\x00" + bytes(rng.getrandbits(8) for _ in range(width * 3)) for _ in range(height))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b"")
+
+CHAT_PAGE = """<!doctype html>
+<html><head><title>Synthetic shared chat</title></head>
+<body>
+<main class="conversation-container" id="chat"></main>
+<script>
+const MESSAGES = %(messages)s;
+const BATCH = %(batch)d;
+const IMAGE_EVERY = %(image_every)d;
+const IMAGES = %(images)d;
+let shown = 0;
+let loading = false;
+function render(n) {
+  const chat = document.getElementById("chat");
+  for (const end = Math.min(shown + n, MESSAGES.length); shown < end; shown++) {
+    const div = document.createElement("div");
+    div.setAttribute("data-message-author-role", shown %% 2 ? "assistant" : "user");
+    div.style.minHeight = "400px";
+    div.textContent = MESSAGES[shown];
+    if (IMAGE_EVERY && shown %% IMAGE_EVERY === 0) {
+      const img = document.createElement("img");
+      img.src = "/img/" + ((shown / IMAGE_EVERY) %% IMAGES) + ".png";
+      div.appendChild(img);
+    }
+    chat.appendChild(div);
+  }
+}
+render(BATCH);
+// Lazy-load older turns near the bottom, like the real share pages
+window.addEventListener("scroll", () => {
+  if (loading || shown >= MESSAGES.length) return;
+  if (window.innerHeight + window.scrollY < document.body.scrollHeight - 1500) return;
+  loading = true;
+  setTimeout(() => { render(BATCH); loading = false; }, %(lazy_delay_ms)d);
+});
+</script>
+</body></html>
+"""
+
+def write_chat_site(root: Path, messages: int, batch: int = 20, image_every: int = 5, images: int = 8,
+                    lazy_delay_ms: int = 120, seed: int = 7) -> Path:
+    """Static share-page fixture: chat.html plus a handful of distinct PNGs under img/."""
+    rng = random.Random(seed)
+    root.mkdir(parents=True, exist_ok=True)
+    (root / "img").mkdir(exist_ok=True)
+    for i in range(images):
+        (root / "img" / f"{i}.png").write_bytes(png_bytes(96, 96, seed + i))
+    html = CHAT_PAGE % {
+        "messages": json.dumps([sentence(rng, 60) for _ in range(messages)]),
+        "batch": batch, "image_every": image_every, "images": images, "lazy_delay_ms": lazy_delay_ms,
+    }
+    (root / "chat.html").write_text(html, encoding="utf-8")
+    return root / "chat.html"
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+def serve_directory(root: Path):
+    """Serves `root` on an ephemeral localhost port. Returns (server, base_url)."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(_QuietHandler, directory=str(root)))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="bench-http", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
@@ -0,0 +1,482 @@
+"""
+Benchmark harness for the ingest pipeline.
+
+    python -m bench                       # every suite, compared against bench/baseline.json if present
+    python -m bench parse analyze         # selected suites
+    python -m bench --save-baseline       # record this run as the new baseline
+
+Each suite runs in its own subprocess against a throwaway XRAY_BASE_DIR/XRAY_VAULT_DIR,
+so peak RSS is per suite and nothing touches the real vault. Gemini is replaced
+by bench.fakes.FakeGeminiClient; share pages are served from localhost. The batch
+suite keeps the real google-genai SDK and points it at a local REST stub instead.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import urlparse
+
+from . import fixtures
+from .fakes import FakeGeminiClient, serve_fake_gemini
+
+SUITES = ("startup", "parse", "scrape", "analyze", "batch", "e2e")
+BASELINE_FILE = Path(__file__).parent / "baseline.json"
+
+class SuiteSkipped(Exception):
+    """An optional dependency of a suite is missing (Playwright/Chromium for scrape)."""
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _isolate(workdir: Path):
+    """
+    Points all pipeline state at workdir. Must run before llm_ingest is imported.
+    GEMINI_BASE_URL reserves a port for the batch suite's REST stub; the other
+    suites swap in FakeGeminiClient and never reach it.
+    """
+    os.environ.update({
+        "XRAY_BASE_DIR": str(workdir / "base"),
+        "XRAY_VAULT_DIR": str(workdir / "vault" / "1 - Rough Notes" / "AI Ingest"),
+        "GEMINI_API_KEY": os.environ.get("GEMINI_API_KEY") or "bench-fake-key",
+        "LLM_CACHE_BYPASS": "1",
+        "LLM_REQUESTS_PER_MINUTE": "1000000",
+        "METRICS_LOG_ENABLED": "0",
+        "METRICS_PORT": "0",
+        "BATCH_LINGER_SECONDS": "0.05",
+        "BATCH_POLL_INTERVAL": "0.05",
+        "GEMINI_BASE_URL": f"http://127.0.0.1:{_free_port()}",
+    })
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+class StageRecorder:
+    """Collects span durations from llm_ingest.metrics for per-stage percentiles."""
+
+    def __init__(self):
+        self.samples = {}
+
+    def __call__(self, name: str, duration: float, status: str):
+        self.samples.setdefault(name, []).append(duration)
+
+    def summary(self) -> dict:
+        from llm_ingest.metrics import percentile
+        return {
+            name: {"count": len(v), "p50_s": percentile(v, 50), "p95_s": percentile(v, 95)}
+            for name, v in sorted(self.samples.items())
+        }
+
+def case_result(name: str, latencies: list, elapsed: float, amount: float, unit: str, stages: dict = None) -> dict:
+    from llm_ingest.metrics import percentile
+    return {
+        "name": name,
+        "items": len(latencies),
+        "elapsed_s": round(elapsed, 3),
+        "throughput": round(amount / max(elapsed, 1e-9), 3),
+        "unit": unit,
+        "p50_s": percentile(latencies, 50),
+        "p95_s": percentile(latencies, 95),
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": stages or {},
+    }
+
+# Suites
+
+# Modules that must stay out of a plain import of the package (see suite_startup)
+HEAVY_MODULES = ("google.genai", "pydantic", "playwright")
+STARTUP_TARGETS = ("llm_ingest.parser", "llm_ingest.analyzer", "llm_ingest.cli", "watcher")
+STARTUP_PROBE = """
+import json, sys, time
+t = time.perf_counter()
+import {module}
+print(json.dumps({{"seconds": time.perf_counter() - t, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+async def suite_startup(workdir: Path, opts) -> list:
+    """
+    Import-time budget: each entry point is imported in a fresh interpreter and
+    must stay under --import-budget without loading the Gemini SDK, pydantic or Playwright.
+    """
+    results = []
+    root = Path(__file__).parent.parent
+    for module in STARTUP_TARGETS:
+        latencies, heavy = [], set()
+        started = time.perf_counter()
+        for _ in range(opts.repeat):
+            proc = subprocess.run(
+                [sys.executable, "-c", STARTUP_PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                cwd=root, capture_output=True, text=True, check=True,
+            )
+            probe = json.loads(proc.stdout.strip().splitlines()[-1])
+            latencies.append(probe["seconds"])
+            heavy.update(probe["heavy"])
+        result = case_result(f"startup/import-{module}", latencies, time.perf_counter() - started,
+                             len(latencies), "runs/s")
+        result["budget_s"] = opts.import_budget
+        result["heavy_modules"] = sorted(heavy)
+        result["failed"] = bool(heavy) or result["p50_s"] > opts.import_budget
+        results.append(result)
+    return results
+
+async def suite_parse(workdir: Path, opts) -> list:
+    from llm_ingest import parser
+    results = []
+    for size in opts.parse_sizes:
+        path = fixtures.write_export(workdir / f"export-{size}.json", size, opts.parse_messages)
+        mb = path.stat().st_size / (1024 * 1024)
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(opts.repeat):
+            t0 = time.perf_counter()
+            text = parser.extract_chatgpt_json(parser.iter_chatgpt_export(path))
+            latencies.append(time.perf_counter() - t0)
+            assert text, "export produced no text"
+        results.append(case_result(f"parse/export-{size}", latencies, time.perf_counter() - started, mb * opts.repeat, "MB/s"))
+    return results
+
+async def suite_scrape(workdir: Path, opts) -> list:
+    try:
+        import playwright  # noqa: F401
+    except ImportError:
+        raise SuiteSkipped("playwright is not installed")
+    from llm_ingest import parser, metrics
+    from llm_ingest.browser_pool import BrowserPool
+    fixtures.write_chat_site(workdir / "site", opts.scrape_messages)
+    server, base_url = fixtures.serve_directory(workdir / "site")
+    recorder = StageRecorder()
+    metrics.add_span_listener(recorder)
+    pool = BrowserPool()
+    latencies = []
+    try:
+        # Warm the pool so the first case doesn't include launching Chromium
+        try:
+            async with pool.lease():
+                pass
+        except Exception as e:
+            if "Executable doesn't exist" not in str(e):
+                raise
+            raise SuiteSkipped("Chromium is not installed (run: playwright install chromium)")
+        started = time.perf_counter()
+        for i in range(opts.scrape_runs):
+            t0 = time.perf_counter()
+            # Unique query per run, or the processed store dedups it
+            text, _ = await parser.parse_url_async(f"{base_url}/chat.html?run={i}", browser_pool=pool)
+            latencies.append(time.perf_counter() - t0)
+            assert text, "scrape produced no text"
+        elapsed = time.perf_counter() - started
+    finally:
+        await pool.close()
+        server.shutdown()
+        metrics.remove_span_listener(recorder)
+    return [case_result(f"scrape/share-page-{opts.scrape_messages}", latencies, elapsed, len(latencies), "pages/s",
+                        recorder.summary())]
+
+def _install_fake_gemini(opts) -> FakeGeminiClient:
+    from llm_ingest import analyzer
+    fake = FakeGeminiClient(latency=opts.llm_latency, jitter=opts.llm_jitter)
+    analyzer.client = fake
+    return fake
+
+async def suite_analyze(workdir: Path, opts) -> list:
+    from llm_ingest import analyzer, metrics
+    from llm_ingest.config import ANALYZE_CONCURRENCY, CONTEXT_TOKEN_BUDGET, CHARS_PER_TOKEN
+    fake = _install_fake_gemini(opts)
+    results = []
+
+    docs = []
+    for i in range(opts.analyze_docs):
+        path = fixtures.write_chat_log(workdir / f"log-{i}.txt", 10 + (i * 37) % 190, seed=i)
+        docs.append(path.read_text(encoding="utf-8"))
+    recorder = StageRecorder()
+    metrics.add_span_listener(recorder)
+    slots = asyncio.Semaphore(ANALYZE_CONCURRENCY)
+    latencies = []
+
+    async def one(doc: str):
+        async with slots:
+            t0 = time.perf_counter()
+            result = await analyzer.analyze_content_async(doc)
+            latencies.append(time.perf_counter() - t0)
+            assert result.get("topic") != analyzer.ERROR_TOPIC, result
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(d) for d in docs))
+    results.append(case_result("analyze/single-call", latencies, time.perf_counter() - started, len(docs),
+                               "docs/s", recorder.summary()))
+
+    # One log just over the context budget exercises map-reduce
+    recorder.samples.clear()
+    words = int(CONTEXT_TOKEN_BUDGET * CHARS_PER_TOKEN * 1.2 / 600)
+    big = fixtures.write_chat_log(workdir / "big.txt", 100, words=words).read_text(encoding="utf-8")
+    t0 = time.perf_counter()
+    result = await analyzer.analyze_content_async(big)
+    elapsed = time.perf_counter() - t0
+    assert result.get("topic") != analyzer.ERROR_TOPIC, result
+    metrics.remove_span_listener(recorder)
+    results.append(case_result("analyze/map-reduce", [elapsed], elapsed, 1, "docs/s", recorder.summary()))
+
+    results.append(await _batch_case("analyze/batch-api", fake, docs))
+    return results
+
+async def _batch_case(name: str, fake: FakeGeminiClient, docs: list) -> dict:
+    """
+    BatchAnalyzer over `docs` as one job with every 5th item failing on the server
+    side, then a job that never finishes, which must be cancelled at the timeout
+    and surface as retryable.
+    """
+    from llm_ingest import analyzer, metrics
+    from llm_ingest.llm_client import LLMUnavailableError
+    recorder = StageRecorder()
+    metrics.add_span_listener(recorder)
+    fake.batch_fail_every = 5
+    batcher = analyzer.BatchAnalyzer(max_requests=len(docs), linger=0.05, use_cache=False, poll_interval=0.05)
+    latencies = []
+
+    async def batched(doc: str):
+        t0 = time.perf_counter()
+        result = await batcher.analyze(doc)
+        latencies.append(time.perf_counter() - t0)
+        return result
+
+    try:
+        started = time.perf_counter()
+        batch_results = await asyncio.gather(*(batched(d) for d in docs))
+        await batcher.close()
+        elapsed = time.perf_counter() - started
+        failed = sum(r.get("topic") == analyzer.ERROR_TOPIC for r in batch_results)
+        assert failed == len(docs) // 5, f"expected {len(docs) // 5} failed batch items, got {failed}"
+
+        fake.batch_fail_every, fake.batch_stuck = 0, True
+        stuck = analyzer.BatchAnalyzer(max_requests=1, use_cache=False, poll_interval=0.05, timeout=0.2)
+        try:
+            await stuck.analyze(docs[0])
+            raise AssertionError("stuck batch job did not time out")
+        except LLMUnavailableError:
+            pass
+        assert fake.cancelled, "timed-out batch job was not cancelled"
+    finally:
+        fake.batch_fail_every, fake.batch_stuck = 0, False
+        metrics.remove_span_listener(recorder)
+    result = case_result(name, latencies, elapsed, len(docs), "docs/s", recorder.summary())
+    result["failed_items"] = failed
+    return result
+
+async def suite_batch(workdir: Path, opts) -> list:
+    """The Batch API through the real google-genai SDK, pointed at the REST stub via GEMINI_BASE_URL."""
+    try:
+        from google import genai  # noqa: F401
+    except ImportError:
+        raise SuiteSkipped("google-genai is not installed")
+    from llm_ingest.config import GEMINI_BASE_URL
+    fake = FakeGeminiClient(latency=opts.llm_latency, jitter=opts.llm_jitter)
+    server, _ = serve_fake_gemini(fake, port=urlparse(GEMINI_BASE_URL).port)
+    docs = [
+        fixtures.write_chat_log(workdir / f"log-{i}.txt", 10 + (i * 37) % 190, seed=i).read_text(encoding="utf-8")
+        for i in range(opts.analyze_docs)
+    ]
+    try:
+        return [await _batch_case("batch/sdk-rest-stub", fake, docs)]
+    finally:
+        server.shutdown()
+
+async def suite_e2e(workdir: Path, opts) -> list:
+    from llm_ingest import cli, metrics
+    _install_fake_gemini(opts)
+    inbox = workdir / "inbox"
+    inbox.mkdir()
+    for i in range(opts.e2e_files):
+        fixtures.write_chat_log(inbox / f"chat-{i:03d}.txt", 20 + (i * 13) % 80, seed=i)
+    fixtures.write_export(inbox / "conversations.json", opts.e2e_export_conversations, 12)
+
+    recorder = StageRecorder()
+    metrics.add_span_listener(recorder)
+    args = cli.build_parser().parse_args(["batch", str(inbox)])
+    started = time.perf_counter()
+    try:
+        code = await cli.run_batch(args)
+    finally:
+        metrics.remove_span_listener(recorder)
+    elapsed = time.perf_counter() - started
+    assert code == 0, "batch run reported failures"
+    notes = len(list(Path(os.environ["XRAY_VAULT_DIR"]).glob("*.md")))
+    latencies = recorder.samples.get("job", [])
+    result = case_result("e2e/batch", latencies, elapsed, notes, "notes/s", recorder.summary())
+    result["notes"] = notes
+    return [result]
+
+SUITE_FUNCS = {"startup": suite_startup, "parse": suite_parse, "scrape": suite_scrape, "analyze": suite_analyze,
+               "batch": suite_batch, "e2e": suite_e2e}
+
+# Running and reporting
+
+def run_suite_in_process(name: str, opts) -> list:
+    with tempfile.TemporaryDirectory(prefix=f"xray-bench-{name}-") as tmp:
+        workdir = Path(tmp)
+        _isolate(workdir)
+        from llm_ingest.config import ensure_dirs
+        ensure_dirs()
+        sink = contextlib.nullcontext() if opts.verbose else contextlib.redirect_stdout(io.StringIO())
+        with sink:
+            return asyncio.run(SUITE_FUNCS[name](workdir, opts))
+
+def _child_args(opts) -> list:
+    return [
+        "--repeat", str(opts.repeat),
+        "--import-budget", str(opts.import_budget),
+        "--parse-sizes", ",".join(map(str, opts.parse_sizes)),
+        "--parse-messages", str(opts.parse_messages),
+        "--scrape-messages", str(opts.scrape_messages),
+        "--scrape-runs", str(opts.scrape_runs),
+        "--analyze-docs", str(opts.analyze_docs),
+        "--e2e-files", str(opts.e2e_files),
+        "--e2e-export-conversations", str(opts.e2e_export_conversations),
+        "--llm-latency", str(opts.llm_latency),
+        "--llm-jitter", str(opts.llm_jitter),
+    ] + (["--verbose"] if opts.verbose else [])
+
+def run_suite(name: str, opts) -> dict:
+    """
+    Runs one suite in a fresh interpreter (clean peak RSS).
+    Returns {'cases': [...]}, {'skipped': reason} or {'error': ...}.
+    """
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+        out = Path(f.name)
+    try:
+        cmd = [sys.executable, "-m", "bench", "--child", name, "--json-out", str(out)] + _child_args(opts)
+        proc = subprocess.run(cmd, cwd=Path(__file__).parent.parent, capture_output=not opts.verbose, text=True)
+        if proc.returncode != 0:
+            tail = (proc.stderr or "").strip().splitlines()[-1:] or [f"exit code {proc.returncode}"]
+            return {"error": tail[0]}
+        return json.loads(out.read_text())
+    finally:
+        out.unlink(missing_ok=True)
+
+def format_results(cases: list) -> str:
+    lines = [f"{'case':38} {'items':>6} {'throughput':>16} {'p50':>9} {'p95':>9} {'peak RSS':>10}"]
+    for c in cases:
+        lines.append(
+            f"{c['name']:38} {c['items']:>6} {c['throughput']:>10} {c['unit']:<5} "
+            f"{c['p50_s']:>8}s {c['p95_s']:>8}s {c['peak_rss_mb']:>7} MB"
+        )
+        if c.get("failed"):
+            lines.append(f"    ! over budget ({c.get('budget_s')}s) or loaded: {', '.join(c.get('heavy_modules', [])) or '-'}")
+        for stage, s in c.get("stages", {}).items():
+            lines.append(f"    {stage:34} {s['count']:>6} {'':>16} {s['p50_s']:>8}s {s['p95_s']:>8}s")
+    return "\n".join(lines)
+
+def compare(cases: list, baseline: dict, tolerance: float) -> list:
+    """Prints deltas against the baseline; returns the names of regressed cases."""
+    base = {c["name"]: c for c in baseline.get("cases", [])}
+    regressions = []
+    print(f"\nCompared with baseline from {baseline.get('saved_at', '?')} (tolerance {tolerance:.0%}):")
+    for c in cases:
+        b = base.get(c["name"])
+        if b is None:
+            print(f"  {c['name']:38} (new)")
+            continue
+        deltas = {
+            "throughput": (c["throughput"] - b["throughput"]) / max(b["throughput"], 1e-9),
+            "p95": (c["p95_s"] - b["p95_s"]) / max(b["p95_s"], 1e-9),
+            "rss": (c["peak_rss_mb"] - b["peak_rss_mb"]) / max(b["peak_rss_mb"], 1e-9),
+        }
+        worse = deltas["throughput"] < -tolerance or deltas["p95"] > tolerance or deltas["rss"] > tolerance
+        if worse:
+            regressions.append(c["name"])
+        print(
+            f"  {c['name']:38} throughput {deltas['throughput']:+.1%}  p95 {deltas['p95']:+.1%}  "
+            f"rss {deltas['rss']:+.1%}{'  <-- REGRESSION' if worse else ''}"
+        )
+    return regressions
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(prog="python -m bench", description="Ingest pipeline benchmarks.")
+    ap.add_argument("suites", nargs="*", help=f"Suites to run (default: all of {', '.join(SUITES)}).")
+    ap.add_argument("--baseline", type=Path, default=BASELINE_FILE, help="Baseline file to compare against / save to.")
+    ap.add_argument("--save-baseline", action="store_true", help="Write this run's results as the baseline.")
+    ap.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative slowdown before flagging.")
+    ap.add_argument("--repeat", type=int, default=3, help="Repetitions for the startup and parse cases.")
+    ap.add_argument("--import-budget", type=float, default=0.25,
+                    help="Max p50 seconds to import an entry point (startup suite).")
+    ap.add_argument("--parse-sizes", type=lambda s: [int(x) for x in s.split(",")], default=[10, 100, 1000],
+                    help="Conversations per synthetic export, comma separated.")
+    ap.add_argument("--parse-messages", type=int, default=20, help="Messages per synthetic conversation.")
+    ap.add_argument("--scrape-messages", type=int, default=120, help="Messages on the fixture share page.")
+    ap.add_argument("--scrape-runs", type=int, default=5)
+    ap.add_argument("--analyze-docs", type=int, default=40)
+    ap.add_argument("--e2e-files", type=int, default=30)
+    ap.add_argument("--e2e-export-conversations", type=int, default=20)
+    ap.add_argument("--llm-latency", type=float, default=0.2, help="Fake Gemini base latency in seconds.")
+    ap.add_argument("--llm-jitter", type=float, default=0.05, help="Fake Gemini uniform jitter in seconds.")
+    ap.add_argument("--in-process", action="store_true", help="Run suites in this process (RSS is then cumulative).")
+    ap.add_argument("--verbose", action="store_true", help="Show pipeline output.")
+    ap.add_argument("--child", choices=SUITES, help=argparse.SUPPRESS)
+    ap.add_argument("--json-out", type=Path, help=argparse.SUPPRESS)
+    return ap
+
+def main(argv=None) -> int:
+    ap = build_parser()
+    opts = ap.parse_args(argv)
+    unknown = [s for s in opts.suites if s not in SUITES]
+    if unknown:
+        ap.error(f"unknown suite(s): {', '.join(unknown)}")
+    if opts.in_process and len(opts.suites or SUITES) > 1:
+        # llm_ingest.config binds the state dirs at import, so only the first suite would be isolated
+        ap.error("--in-process runs exactly one suite")
+    if opts.child:
+        try:
+            result = {"cases": run_suite_in_process(opts.child, opts)}
+        except SuiteSkipped as e:
+            result = {"skipped": str(e)}
+        opts.json_out.write_text(json.dumps(result))
+        return 0
+
+    cases, errors = [], []
+    for name in opts.suites or SUITES:
+        print(f"Running {name}...", flush=True)
+        if opts.in_process:
+            try:
+                result = {"cases": run_suite_in_process(name, opts)}
+            except SuiteSkipped as e:
+                result = {"skipped": str(e)}
+        else:
+            result = run_suite(name, opts)
+        if "skipped" in result:
+            print(f"  ! {name} skipped: {result['skipped']}", flush=True)
+            continue
+        if "error" in result:
+            print(f"  ! {name} FAILED: {result['error']}", flush=True)
+            errors.append(name)
+            continue
+        cases.extend(result["cases"])
+
+    print()
+    print(format_results(cases))
+
+    regressions = []
+    if opts.baseline.exists() and not opts.save_baseline:
+        regressions = compare(cases, json.loads(opts.baseline.read_text()), opts.tolerance)
+    if opts.save_baseline:
+        opts.baseline.write_text(json.dumps({
+            "saved_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cases": cases,
+        }, indent=2))
+        print(f"\nBaseline saved to {opts.baseline}")
+    failed = [c["name"] for c in cases if c.get("failed")]
+    return 1 if regressions or failed or errors else 0
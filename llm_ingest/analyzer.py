@@ -1,41 +1,182 @@
+import os
 import json
-from typing import List, Optional
-from google import genai
-from pydantic import BaseModel, Field, ValidationError
-from .config import GEMINI_API_KEY
-
-# Use v1beta for structured output support
-client = genai.Client(
-    api_key=GEMINI_API_KEY, 
-    http_options={"api_version": "v1beta"}
+import math
+import time
+import asyncio
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Optional
+from .config import (
+    GEMINI_API_KEY, GEMINI_BASE_URL, MODEL_CACHE_FILE, MODEL_CACHE_TTL, MODEL_QUOTA_BACKOFF, LLM_CACHE_BYPASS,
+    CONTEXT_TOKEN_BUDGET, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, CHARS_PER_TOKEN, EXACT_COUNT_THRESHOLD, MAP_CONCURRENCY,
+    BATCH_MAX_REQUESTS, BATCH_MAX_BYTES, BATCH_LINGER_SECONDS, BATCH_POLL_INTERVAL, BATCH_TIMEOUT,
 )
+from .chunker import split_messages, chunk_messages
+from .ratelimit import get_llm_limiter
+from .llm_client import LLMUnavailableError, error_code, is_retryable, get_llm_client
+from . import metrics
+from .response_cache import cache_key, get_response_cache
+
+if TYPE_CHECKING:
+    from google import genai
+
+_client = None
+
+def get_client() -> "genai.Client":
+    """
+    The shared Gemini client, built on first use so importing the package stays
+    fast and works without an API key. Assigning `analyzer.client` swaps in a stub.
+    """
+    global _client
+    override = globals().get("client")
+    if override is not None:
+        return override
+    if _client is None:
+        from google import genai
+        # Use v1beta for structured output support
+        http_options = {"api_version": "v1beta"}
+        if GEMINI_BASE_URL:
+            # e.g. a local stub server for the batch endpoints
+            http_options["base_url"] = GEMINI_BASE_URL
+        _client = genai.Client(
+            api_key=GEMINI_API_KEY, 
+            http_options=http_options
+        )
+    return _client
+
+def __getattr__(name: str):
+    # Lazy module attributes: `analyzer.client` and `analyzer.KnowledgeMine`
+    if name == "client":
+        return get_client()
+    if name == "KnowledgeMine":
+        return knowledge_mine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Topic used for the fallback note when analysis fails
+ERROR_TOPIC = "Processing Error"
 
 PREFERRED_MODELS = ["gemini-3-flash-preview", "gemini-2.5-flash", "gemini-2.0-flash-exp"]
 
-def pick_model(client: genai.Client) -> str:
+# Used when listing fails and nothing is cached
+DEFAULT_MODEL = "gemini-2.0-flash"
+
+def list_generate_models(client: "genai.Client") -> List[str]:
+    """
+    Lists models that support generateContent, ordered by preference:
+    PREFERRED_MODELS first, then everything else alphabetically.
+    """
+    available = set()
+    for m in client.models.list():
+        if "generateContent" in getattr(m, "supported_actions", []):
+            # m.name is like "models/gemini-3-flash-preview"
+            available.add(m.name.replace("models/", ""))
+
+    if not available:
+        raise RuntimeError("No Gemini models available for this API key.")
+    preferred = [name for name in PREFERRED_MODELS if name in available]
+    return preferred + sorted(available - set(preferred))
+
+def pick_model(client: "genai.Client") -> str:
     """
     Dynamically discovers available models that support generateContent.
     """
     try:
-        available = set()
-        for m in client.models.list():
-            if "generateContent" in getattr(m, "supported_actions", []):
-                # m.name is like "models/gemini-3-flash-preview"
-                available.add(m.name.replace("models/", ""))
-
-        for name in PREFERRED_MODELS:
-            if name in available:
-                return name
-        
-        # Fallback to the first available if none of our preferred ones are found
-        if available:
-            return sorted(list(available))[0]
-            
-        raise RuntimeError("No Gemini models available for this API key.")
+        return list_generate_models(client)[0]
     except Exception as e:
         print(f"  ! Error listing models: {e}")
         # Final fallback to a sane default
-        return "gemini-2.0-flash"
+        return DEFAULT_MODEL
+
+class ModelResolver:
+    """
+    Caches the ordered model list with a TTL, persisted to disk so restarts skip
+    the listing call. Once stale, the cached list keeps serving while a background
+    task re-lists. Models that 404 or hit quota are benched so callers fall back
+    to the next candidate without re-listing.
+    """
+
+    def __init__(self, cache_file: Path = MODEL_CACHE_FILE, ttl: float = MODEL_CACHE_TTL):
+        self.cache_file = Path(cache_file)
+        self.ttl = ttl
+        self.models = []
+        self.resolved_at = 0.0
+        self._benched = {}
+        self._lock = None
+        self._refresh_task = None
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_file, 'r') as f:
+                data = json.load(f)
+            self.models = list(data["models"])
+            self.resolved_at = float(data["resolved_at"])
+        except Exception:
+            pass
+
+    def _save(self):
+        try:
+            tmp = self.cache_file.with_suffix('.tmp')
+            with open(tmp, 'w') as f:
+                json.dump({"models": self.models, "resolved_at": self.resolved_at}, f)
+            os.replace(tmp, self.cache_file)
+        except OSError as e:
+            print(f"  ! Could not persist model cache: {e}")
+
+    def is_stale(self) -> bool:
+        return time.time() - self.resolved_at > self.ttl
+
+    async def refresh(self, client: "genai.Client"):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            # Another caller may have refreshed while we waited
+            if self.models and not self.is_stale():
+                return
+            try:
+                models = await asyncio.to_thread(list_generate_models, client)
+            except Exception as e:
+                print(f"  ! Error listing models: {e}")
+                if not self.models:
+                    # Retry the listing after a minute instead of on every call
+                    self.models = [DEFAULT_MODEL]
+                    self.resolved_at = time.time() - self.ttl + 60
+                return
+            self.models = models
+            self.resolved_at = time.time()
+            self._benched.clear()
+            self._save()
+
+    def _refresh_in_background(self, client: "genai.Client"):
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self.refresh(client))
+
+    async def candidates(self, client: "genai.Client") -> List[str]:
+        """Ordered models to try, skipping ones benched after 404/quota errors."""
+        if not self.models:
+            await self.refresh(client)
+        elif self.is_stale():
+            self._refresh_in_background(client)
+        now = time.time()
+        usable = [m for m in self.models if self._benched.get(m, 0) <= now]
+        # If everything is benched, try the least recently benched rather than nothing
+        return usable or sorted(self.models, key=lambda m: self._benched.get(m, 0))[:1]
+
+    def bench(self, model_name: str, seconds: float):
+        self._benched[model_name] = time.time() + seconds
+
+model_resolver = ModelResolver()
+
+async def warm_up():
+    """
+    Builds the client and resolves models off the event loop (the SDK import is slow).
+    Failures are only logged; the first analysis retries the same steps.
+    """
+    try:
+        client = await asyncio.to_thread(get_client)
+        if model_resolver.is_stale():
+            await model_resolver.refresh(client)
+    except Exception as e:
+        print(f"  ! Model warm-up failed: {e}", flush=True)
 
 SYSTEM_PROMPT = """
 You are the "Pragmatic Architect"—the professional, analytical, and grounded-in-systems persona for Mark's Digital Brain. 
@@ -61,54 +202,477 @@ Your goal is to "Destructure" conversation logs into permanent, high-value Obsid
 }
 """
 
-class KnowledgeMine(BaseModel):
-    topic: str = Field(description="Title Case, technical summary.")
-    tags: List[str]
-    problem_context: str
-    solution_insight: str
-    code_snippet: Optional[str] = Field(None, description="The 'Utility' artifact. Code, sequence, or recipe.")
-    blog_post: str = Field(description="1st-person technical reflection. Scale length to complexity.")
+_knowledge_mine = None
+_knowledge_schema = None
+
+def knowledge_mine():
+    """The KnowledgeMine pydantic model, defined on first use so pydantic loads lazily."""
+    global _knowledge_mine
+    if _knowledge_mine is None:
+        from pydantic import BaseModel, Field
+
+        class KnowledgeMine(BaseModel):
+            topic: str = Field(description="Title Case, technical summary.")
+            tags: List[str]
+            problem_context: str
+            solution_insight: str
+            code_snippet: Optional[str] = Field(None, description="The 'Utility' artifact. Code, sequence, or recipe.")
+            blog_post: str = Field(description="1st-person technical reflection. Scale length to complexity.")
+
+        _knowledge_mine = KnowledgeMine
+    return _knowledge_mine
+
+def knowledge_schema() -> dict:
+    global _knowledge_schema
+    if _knowledge_schema is None:
+        _knowledge_schema = knowledge_mine().model_json_schema()
+    return _knowledge_schema
+
+def validate_knowledge(text: str) -> dict:
+    """Parses a structured-output response into a KnowledgeMine dict (raises on mismatch)."""
+    return knowledge_mine().model_validate_json(text).model_dump()
+
+# Callbacks receiving one dict per Gemini call (model, latency_s, tokens, ok, attempt)
+_call_listeners = []
+
+def add_call_listener(fn):
+    _call_listeners.append(fn)
 
-async def analyze_content_async(content: str) -> dict:
+def remove_call_listener(fn):
+    if fn in _call_listeners:
+        _call_listeners.remove(fn)
+
+def _notify_call(**record):
+    for fn in list(_call_listeners):
+        try:
+            fn(record)
+        except Exception:
+            pass
+
+async def generate_json_async(prompt: str, schema: dict = None):
+    """
+    Structured-output call against the cached model list, through the shared
+    LLMClient (rate budgets, retries with backoff, optional hedging).
+    On 404 or exhausted quota/5xx retries the next candidate model is tried;
+    if the last one is still unavailable, LLMUnavailableError propagates.
+    Returns (response, model_name).
+    """
+    if schema is None:
+        schema = knowledge_schema()
+    models = await model_resolver.candidates(get_client())
+    for i, model_name in enumerate(models):
+        print(f"  > Analyzing with Gemini model: {model_name}", flush=True)
+        started = time.monotonic()
+        info = {}
+        try:
+            with metrics.span("llm_call", model=model_name, attempt=i + 1, prompt_chars=len(prompt)) as sp:
+                resp = await get_llm_client().generate_content(
+                    model=model_name,
+                    contents=prompt,
+                    config={
+                        "response_mime_type": "application/json",
+                        "response_json_schema": schema,
+                        "temperature": 0,
+                    },
+                    info=info,
+                )
+                sp.update(output_chars=len(resp.text or ""), retries=info["retries"], hedged=info["hedged"])
+            usage = getattr(resp, "usage_metadata", None)
+            _notify_call(
+                model=model_name, ok=True, latency_s=time.monotonic() - started, attempt=i + 1,
+                prompt_chars=len(prompt), output_chars=len(resp.text or ""),
+                prompt_tokens=getattr(usage, "prompt_token_count", None) or 0,
+                output_tokens=getattr(usage, "candidates_token_count", None) or 0,
+                retries=info["retries"], hedged=info["hedged"],
+            )
+            return resp, model_name
+        except Exception as e:
+            _notify_call(
+                model=model_name, ok=False, latency_s=time.monotonic() - started, attempt=i + 1,
+                prompt_chars=len(prompt), output_chars=0, prompt_tokens=0, output_tokens=0, error=str(e),
+                retries=info.get("retries", 0), hedged=info.get("hedged", False),
+            )
+            code = error_code(e.__cause__ or e) if isinstance(e, LLMUnavailableError) else error_code(e)
+            if i == len(models) - 1 or not (code == 404 or isinstance(e, LLMUnavailableError)):
+                raise
+            # A 404 means the model is gone until the next listing; quota recovers sooner
+            if code == 404:
+                model_resolver.bench(model_name, model_resolver.ttl)
+            elif code == 429:
+                model_resolver.bench(model_name, MODEL_QUOTA_BACKOFF)
+            print(f"  ! {model_name} unavailable ({code}), falling back to {models[i + 1]}", flush=True)
+
+MAP_PROMPT = """
+This is part {index} of {total} of one long conversation log, in chronological order.
+Parts overlap slightly at the edges. Extract the insights, artifacts and turning points
+from THIS part only; they will be merged with the other parts afterwards.
+In blog_post, summarise how the thinking evolved within this part.
+"""
+
+REDUCE_PROMPT = """
+Below are partial extractions from consecutive parts of ONE long conversation, in
+chronological order (JSON list). Merge them into a single note:
+- Deduplicate overlapping points; prefer the latest, most refined version of a solution.
+- Combine the artifacts into one coherent, drop-in reference.
+- The blog_post must tell the Evolution of Thought across all parts, using ### headings.
+"""
+
+UPDATE_PROMPT = """
+The conversation below was already turned into a note, summarised under EXISTING NOTE.
+It has since continued. Analyze ONLY the NEW MESSAGES; the result is appended to the note:
+- topic: a short Title Case label for what the new messages add.
+- tags: tags for the new material only (existing tags are kept).
+- Don't repeat what the existing note already covers; refer to it only where the new messages build on it.
+- blog_post: a follow-up in the same voice, scaled to the size of the new material.
+"""
+
+async def count_tokens_async(text: str, model_name: str) -> int:
+    """Exact count from the API; falls back to the CHARS_PER_TOKEN estimate."""
+    try:
+        await get_llm_limiter().acquire()
+        resp = await get_client().aio.models.count_tokens(model=model_name, contents=text)
+        if resp.total_tokens:
+            return resp.total_tokens
+    except Exception as e:
+        print(f"  ! Token count failed, estimating: {e}", flush=True)
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def _estimator(chars_per_token: float):
+    return lambda text: math.ceil(len(text) / chars_per_token)
+
+async def _extract_async(prompt: str) -> tuple:
+    resp, model_name = await generate_json_async(prompt)
+    if not resp.text:
+        raise ValueError("Empty response from Gemini")
+    # Validate via Pydantic
+    return validate_knowledge(resp.text), model_name
+
+async def _gather_or_cancel(coros) -> list:
+    """asyncio.gather that cancels the calls still running once one of them fails."""
+    tasks = [asyncio.ensure_future(c) for c in coros]
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+async def _map_reduce_async(content: str, count_tokens, framing: str = "") -> tuple:
+    """
+    Splits at message boundaries, extracts a KnowledgeMine fragment per chunk
+    concurrently, then merges the fragments (hierarchically if they don't fit).
+    `framing` goes after the system prompt of every map and reduce call.
+    """
+    chunks = chunk_messages(split_messages(content), CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, count_tokens)
+    print(f"  > Content exceeds budget; map-reduce over {len(chunks)} chunks", flush=True)
+    slots = asyncio.Semaphore(MAP_CONCURRENCY)
+
+    async def extract(i: int, chunk: str):
+        async with slots:
+            prompt = (
+                SYSTEM_PROMPT
+                + framing
+                + MAP_PROMPT.format(index=i + 1, total=len(chunks))
+                + "\nHere is the conversation log part to analyze:\n\n"
+                + chunk
+            )
+            fragment, _ = await _extract_async(prompt)
+            return fragment
+
+    # One chunk failing (e.g. LLMUnavailableError) fails the whole analysis; stop spending on the rest
+    fragments = await _gather_or_cancel(extract(i, c) for i, c in enumerate(chunks))
+
+    while True:
+        groups = chunk_messages(
+            [json.dumps(f, ensure_ascii=False) + "\n" for f in fragments],
+            CONTEXT_TOKEN_BUDGET, 0, count_tokens,
+        )
+        # A single group, or fragments too large to pair up: one final merge
+        if len(groups) == 1 or len(groups) >= len(fragments):
+            groups = ["".join(groups)]
+            return await _extract_async(SYSTEM_PROMPT + framing + REDUCE_PROMPT + "\n[\n" + groups[0] + "]")
+        # Too many fragments for one reduce call: merge each group first
+        print(f"  > Reducing {len(fragments)} fragments in {len(groups)} groups", flush=True)
+        results = await _gather_or_cancel(
+            _extract_async(SYSTEM_PROMPT + framing + REDUCE_PROMPT + "\n[\n" + g + "]") for g in groups
+        )
+        fragments = [r[0] for r in results]
+
+ANALYSIS_PROMPT = (
+    "\n\nAnalyze this conversation log and extract relevant insights.\n\n"
+    "Here is the conversation log to analyze:\n\n"
+)
+
+# Every prompt a cached result can depend on (single call or map-reduce), so editing any of them
+# invalidates the entries it produced
+ANALYSIS_PROMPTS = (SYSTEM_PROMPT, ANALYSIS_PROMPT, MAP_PROMPT, REDUCE_PROMPT)
+UPDATE_PROMPTS = (SYSTEM_PROMPT, UPDATE_PROMPT, MAP_PROMPT, REDUCE_PROMPT)
+
+def _cache_key(content: str, model_name: str, prompts: tuple = ANALYSIS_PROMPTS) -> str:
+    return cache_key(content, "\x00".join(prompts), model_name, knowledge_schema())
+
+def _analysis_prompt(content: str) -> str:
+    return SYSTEM_PROMPT + ANALYSIS_PROMPT + content
+
+def _error_result(e: Exception) -> dict:
+    return {
+        "topic": ERROR_TOPIC,
+        "tags": ["error", "automation"],
+        "problem_context": "An error occurred during LLM analysis.",
+        "solution_insight": str(e),
+        "code_snippet": None,
+        "blog_post": "Analysis failed."
+    }
+
+async def _cache_lookup(cache, content: str, prompts: tuple = ANALYSIS_PROMPTS):
+    """One lookup, under the model a fresh call would go to first."""
+    model_name = (await model_resolver.candidates(get_client()))[0]
+    cached = cache.get(_cache_key(content, model_name, prompts))
+    if cached is not None:
+        stats = cache.stats()
+        print(f"  > LLM cache hit ({model_name}; {stats['hits']} hits / {stats['misses']} misses)", flush=True)
+    return cached
+
+async def analyze_content_async(content: str, use_cache: bool = True) -> dict:
     """
     Sends the content to Gemini for extraction using structured output.
     Uses dynamic model selection to avoid 404s.
+    Results are cached by content hash; pass use_cache=False (or set
+    LLM_CACHE_BYPASS=1) to force a fresh call.
     """
+    cache = get_response_cache() if use_cache and not LLM_CACHE_BYPASS else None
     try:
-        model_name = pick_model(client)
-        print(f"  > Analyzing with Gemini model: {model_name}", flush=True)
+        if cache is not None:
+            cached = await _cache_lookup(cache, content)
+            if cached is not None:
+                return cached
 
-        prompt = (
-            SYSTEM_PROMPT
-            + "\n\nAnalyze this conversation log and extract relevant insights.\n\n"
-            + "Here is the conversation log to analyze:\n\n"
-            + content[:700000] 
-        )
+        total_tokens = math.ceil(len(content) / CHARS_PER_TOKEN)
+        count_tokens = _estimator(CHARS_PER_TOKEN)
+        if total_tokens > CONTEXT_TOKEN_BUDGET * EXACT_COUNT_THRESHOLD:
+            # Near or over the budget: one exact count decides, and calibrates chunking
+            models = await model_resolver.candidates(get_client())
+            total_tokens = await count_tokens_async(content, models[0])
+            count_tokens = _estimator(max(len(content) / max(total_tokens, 1), 1.0))
 
-        resp = await client.aio.models.generate_content(
-            model=model_name,
-            contents=prompt,
-            config={
-                "response_mime_type": "application/json",
-                "response_json_schema": KnowledgeMine.model_json_schema(),
-                "temperature": 0,
-            },
-        )
+        if total_tokens <= CONTEXT_TOKEN_BUDGET:
+            result, model_name = await _extract_async(_analysis_prompt(content))
+        else:
+            result, model_name = await _map_reduce_async(content, count_tokens)
 
-        if not resp.text:
-            raise ValueError("Empty response from Gemini")
+        if cache is not None:
+            cache.put(_cache_key(content, model_name), result)
+        return result
 
-        # Validate via Pydantic
-        obj = KnowledgeMine.model_validate_json(resp.text)
-        return obj.model_dump()
+    except LLMUnavailableError:
+        # Transient (quota / 5xx): let the caller retry later instead of writing an error note
+        raise
+    except Exception as e:
+        print(f"Error during Gemini Analysis: {e}")
+        return _error_result(e)
 
-    except (ValidationError, json.JSONDecodeError, Exception) as e:
+async def analyze_update_async(new_content: str, note_summary: str, use_cache: bool = True) -> dict:
+    """
+    Analyzes messages appended to an already-ingested conversation, with a
+    compact summary of the existing note as context. Cost scales with the new
+    content only; a delta over the context budget is map-reduced, with the
+    update instructions and the summary in every map and reduce prompt.
+    """
+    cache = get_response_cache() if use_cache and not LLM_CACHE_BYPASS else None
+    material = "\n## EXISTING NOTE\n" + note_summary + "\n\n## NEW MESSAGES\n\n" + new_content
+    try:
+        if cache is not None:
+            cached = await _cache_lookup(cache, material, UPDATE_PROMPTS)
+            if cached is not None:
+                return cached
+
+        if math.ceil(len(material) / CHARS_PER_TOKEN) <= CONTEXT_TOKEN_BUDGET:
+            result, model_name = await _extract_async(SYSTEM_PROMPT + UPDATE_PROMPT + material)
+        else:
+            framing = UPDATE_PROMPT + "\n## EXISTING NOTE\n" + note_summary + "\n\nThe NEW MESSAGES follow in parts.\n"
+            result, model_name = await _map_reduce_async(new_content, _estimator(CHARS_PER_TOKEN), framing)
+
+        if cache is not None:
+            cache.put(_cache_key(material, model_name, UPDATE_PROMPTS), result)
+        return result
+
+    except LLMUnavailableError:
+        raise
+    except Exception as e:
         print(f"Error during Gemini Analysis: {e}")
-        return {
-            "topic": "Processing Error",
-            "tags": ["error", "automation"],
-            "problem_context": "An error occurred during LLM analysis.",
-            "solution_insight": str(e),
-            "code_snippet": None,
-            "blog_post": "Analysis failed."
-        }
+        return _error_result(e)
+
+# Batch API: ~half the price of interactive calls, results within hours
+BATCH_DONE_STATES = {"JOB_STATE_SUCCEEDED", "JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"}
+
+def _batch_request(prompt: str, schema: dict) -> dict:
+    return {
+        "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+        "config": {
+            "response_mime_type": "application/json",
+            "response_json_schema": schema,
+            "temperature": 0,
+        },
+    }
+
+async def run_batch_job_async(prompts: List[str], poll_interval: float = BATCH_POLL_INTERVAL,
+                              timeout: float = BATCH_TIMEOUT) -> tuple:
+    """
+    Submits the prompts as one inline Gemini batch job and polls until it finishes.
+    Returns ([dict | Exception per prompt, in order], model_name). Each result
+    is validated against KnowledgeMine; a bad item doesn't fail the others.
+    """
+    schema = knowledge_schema()
+    requests = [_batch_request(p, schema) for p in prompts]
+    client = get_client()
+    models = await model_resolver.candidates(client)
+    for i, model_name in enumerate(models):
+        await get_llm_limiter().acquire()
+        try:
+            job = await client.aio.batches.create(
+                model=model_name, src=requests,
+                config={"display_name": f"xray-synthesis-{int(time.time())}-{len(prompts)}"},
+            )
+            break
+        except Exception as e:
+            code = error_code(e)
+            if code not in (404, 429) or i == len(models) - 1:
+                raise
+            model_resolver.bench(model_name, model_resolver.ttl if code == 404 else MODEL_QUOTA_BACKOFF)
+            print(f"  ! {model_name} unavailable for batch ({code}), falling back to {models[i + 1]}", flush=True)
+
+    print(f"  > Submitted batch {job.name}: {len(prompts)} requests on {model_name}", flush=True)
+    started = time.monotonic()
+    state = getattr(job.state, "name", str(job.state))
+    while state not in BATCH_DONE_STATES:
+        if time.monotonic() - started > timeout:
+            try:
+                await client.aio.batches.cancel(name=job.name)
+            except Exception as e:
+                print(f"  ! Could not cancel batch {job.name}: {e}", flush=True)
+            raise TimeoutError(f"Batch {job.name} still {state} after {timeout:.0f}s")
+        await asyncio.sleep(poll_interval)
+        job = await client.aio.batches.get(name=job.name)
+        state = getattr(job.state, "name", str(job.state))
+
+    elapsed = time.monotonic() - started
+    print(f"  > Batch {job.name} finished: {state} after {elapsed:.0f}s", flush=True)
+    if state != "JOB_STATE_SUCCEEDED":
+        _notify_call(
+            model=model_name, ok=False, latency_s=elapsed, prompt_chars=sum(map(len, prompts)),
+            output_chars=0, prompt_tokens=0, output_tokens=0, error=state, batch_size=len(prompts),
+        )
+        raise RuntimeError(f"Batch {job.name} ended in {state}: {getattr(job, 'error', None)}")
+
+    responses = list(getattr(job.dest, "inlined_responses", None) or [])
+    results, output_chars, prompt_tokens, output_tokens = [], 0, 0, 0
+    for index in range(len(prompts)):
+        item = responses[index] if index < len(responses) else None
+        try:
+            if item is None:
+                raise ValueError("Missing response in batch output")
+            if getattr(item, "error", None):
+                raise RuntimeError(f"Batch item failed: {item.error}")
+            text = item.response.text
+            if not text:
+                raise ValueError("Empty response from Gemini")
+            usage = getattr(item.response, "usage_metadata", None)
+            prompt_tokens += getattr(usage, "prompt_token_count", None) or 0
+            output_tokens += getattr(usage, "candidates_token_count", None) or 0
+            output_chars += len(text)
+            results.append(validate_knowledge(text))
+        except Exception as e:
+            results.append(e)
+    _notify_call(
+        model=model_name, ok=True, latency_s=elapsed, prompt_chars=sum(map(len, prompts)),
+        output_chars=output_chars, prompt_tokens=prompt_tokens, output_tokens=output_tokens,
+        batch_size=len(prompts),
+    )
+    return results, model_name
+
+class BatchAnalyzer:
+    """
+    Drop-in for analyze_content_async that coalesces concurrent calls into
+    Gemini batch jobs. A job is submitted once `max_requests` or `max_bytes`
+    of prompts are pending, or `linger` seconds after the last arrival.
+    Cache hits return immediately; logs over the context budget still go
+    through the direct map-reduce path.
+    """
+
+    def __init__(self, max_requests: int = BATCH_MAX_REQUESTS, max_bytes: int = BATCH_MAX_BYTES,
+                 linger: float = BATCH_LINGER_SECONDS, use_cache: bool = True,
+                 poll_interval: float = BATCH_POLL_INTERVAL, timeout: float = BATCH_TIMEOUT):
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.linger = linger
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.cache = get_response_cache() if use_cache and not LLM_CACHE_BYPASS else None
+        self._pending = []
+        self._pending_bytes = 0
+        self._timer = None
+        self._jobs = set()
+
+    async def analyze(self, content: str) -> dict:
+        try:
+            if self.cache is not None:
+                cached = await _cache_lookup(self.cache, content)
+                if cached is not None:
+                    return cached
+        except Exception as e:
+            print(f"Error during Gemini Analysis: {e}")
+            return _error_result(e)
+        if math.ceil(len(content) / CHARS_PER_TOKEN) > CONTEXT_TOKEN_BUDGET:
+            return await analyze_content_async(content)
+
+        prompt = _analysis_prompt(content)
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((content, prompt, future))
+        self._pending_bytes += len(prompt.encode('utf-8'))
+        if len(self._pending) >= self.max_requests or self._pending_bytes >= self.max_bytes:
+            self.flush()
+        else:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = asyncio.get_running_loop().call_later(self.linger, self.flush)
+        return await future
+
+    def flush(self):
+        """Submits everything pending as one batch job."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        pending, self._pending, self._pending_bytes = self._pending, [], 0
+        task = asyncio.create_task(self._run(pending))
+        self._jobs.add(task)
+        task.add_done_callback(self._jobs.discard)
+
+    async def _run(self, pending: list):
+        try:
+            results, model_name = await run_batch_job_async(
+                [prompt for _, prompt, _ in pending], poll_interval=self.poll_interval, timeout=self.timeout,
+            )
+        except Exception as e:
+            print(f"Error during Gemini Batch Analysis: {e}")
+            if is_retryable(e):
+                e = LLMUnavailableError(f"Batch job failed: {e}")
+            results, model_name = [e] * len(pending), None
+        for (content, _, future), result in zip(pending, results):
+            if future.done():
+                continue
+            if isinstance(result, LLMUnavailableError):
+                future.set_exception(result)
+                continue
+            if isinstance(result, Exception):
+                result = _error_result(result)
+            elif self.cache is not None:
+                self.cache.put(_cache_key(content, model_name), result)
+            future.set_result(result)
+
+    async def close(self):
+        """Submits the remainder and waits for all outstanding jobs."""
+        self.flush()
+        while self._jobs:
+            await asyncio.gather(*list(self._jobs), return_exceptions=True)
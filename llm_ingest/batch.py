@@ -0,0 +1,139 @@
+import asyncio
+import hashlib
+import json
+import time
+from contextlib import nullcontext
+from pathlib import Path
+from . import parser, analyzer, writer
+from .config import BATCH_PROGRESS_DIR, ANALYZE_CONCURRENCY
+
+# Progress line every N finished conversations
+PROGRESS_EVERY = 10
+
+def export_key(file_path: Path) -> str:
+    """Identifies an export by size + leading bytes, so a renamed re-drop resumes too."""
+    h = hashlib.sha256()
+    h.update(str(file_path.stat().st_size).encode())
+    with open(file_path, 'rb') as f:
+        h.update(f.read(1 << 20))
+    return h.hexdigest()[:16]
+
+def conversation_id(conv: dict, index: int) -> str:
+    return str(conv.get('id') or conv.get('conversation_id') or f"idx-{index}")
+
+class BatchProgress:
+    """
+    Append-only record of finished conversations for one export.
+    Survives crashes: on restart, conversations already listed are skipped.
+    """
+
+    def __init__(self, key: str, progress_dir: Path = BATCH_PROGRESS_DIR):
+        self.path = progress_dir / f"{key}.jsonl"
+        self.done = {}
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                        self.done[rec['id']] = rec.get('note')
+                    except (ValueError, KeyError):
+                        # Torn final line from a crash mid-write
+                        continue
+
+    def record(self, conv_id: str, note_path: Path):
+        self.done[conv_id] = str(note_path)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({"id": conv_id, "note": str(note_path)}) + "\n")
+            f.flush()
+
+    def clear(self):
+        self.path.unlink(missing_ok=True)
+
+def is_multi_conversation_export(file_path: Path) -> bool:
+    """True for ChatGPT exports holding more than one conversation (reads at most two)."""
+    if parser.source_suffix(file_path) != '.json':
+        return False
+    try:
+        return len(list(zip(range(2), parser.iter_chatgpt_export(file_path)))) > 1
+    except (ValueError, OSError):
+        return False
+
+async def run_split_export(file_path: Path, source_name: str, stage=None, concurrency: int = ANALYZE_CONCURRENCY,
+                           analyze=None) -> dict:
+    """
+    Fans a ChatGPT export out into one analyze/write job per conversation.
+    Conversations are streamed, at most `concurrency` are in flight, and finished
+    ones are recorded so a crashed batch resumes where it stopped.
+    `stage(name)` lets the watcher apply its per-stage limits; `analyze` replaces
+    analyzer.analyze_content_async (e.g. with a BatchAnalyzer).
+    Returns a summary dict (written, skipped, failed, notes).
+    """
+    stage = stage or (lambda name: nullcontext())
+    analyze = analyze or analyzer.analyze_content_async
+    progress = BatchProgress(await asyncio.to_thread(export_key, file_path))
+    if progress.done:
+        print(f"  > Resuming batch: {len(progress.done)} conversations already written", flush=True)
+
+    summary = {"written": 0, "skipped": 0, "failed": 0, "notes": []}
+    slots = asyncio.Semaphore(max(1, concurrency))
+    started = time.monotonic()
+    tasks = set()
+
+    def report():
+        finished = summary["written"] + summary["failed"]
+        rate = finished / max(time.monotonic() - started, 1e-9) * 60
+        print(
+            f"  > [BATCH] written={summary['written']} failed={summary['failed']} "
+            f"skipped={summary['skipped']} in_flight={len(tasks)} rate={rate:.1f}/min",
+            flush=True,
+        )
+
+    async def process(conv_id: str, title: str, text: str):
+        try:
+            async with stage("analyze"):
+                analysis = await analyze(text)
+            if analysis.get('topic') == analyzer.ERROR_TOPIC:
+                # Not recorded, so a resumed run retries it
+                summary["failed"] += 1
+                print(f"  ! Analysis failed for '{title}': {analysis.get('solution_insight')}", flush=True)
+                return
+            async with stage("write"):
+                note_path = await writer.write_note_async(analysis, original_source=f"{source_name}#{title}")
+            progress.record(conv_id, note_path)
+            summary["written"] += 1
+            summary["notes"].append(note_path)
+        except Exception as e:
+            summary["failed"] += 1
+            print(f"  ! Failed conversation '{title}': {e}", flush=True)
+        finally:
+            slots.release()
+            if (summary["written"] + summary["failed"]) % PROGRESS_EVERY == 0:
+                report()
+
+    conversations = parser.iter_chatgpt_export(file_path)
+    index = 0
+    while True:
+        # Decoding a large conversation is CPU-bound; keep it off the loop
+        conv = await asyncio.to_thread(next, conversations, None)
+        if conv is None:
+            break
+        conv_id = conversation_id(conv, index)
+        index += 1
+        if conv_id in progress.done:
+            summary["skipped"] += 1
+            continue
+        if next(parser.iter_conversation_messages(conv), None) is None:
+            summary["skipped"] += 1
+            continue
+        text = parser.extract_conversation_text(conv)
+        await slots.acquire()
+        task = asyncio.create_task(process(conv_id, conv.get('title', 'Unknown Title'), text))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        await asyncio.gather(*tasks)
+    report()
+    if summary["failed"] == 0:
+        progress.clear()
+    return summary
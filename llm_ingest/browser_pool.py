@@ -0,0 +1,125 @@
+import asyncio
+from contextlib import asynccontextmanager
+from .config import BROWSER_POOL_SIZE, PAGES_PER_BROWSER, BROWSER_RECYCLE_AFTER
+from . import metrics
+
+class _PooledBrowser:
+    def __init__(self, browser):
+        self.browser = browser
+        self.active = 0
+        self.jobs = 0
+        self.retiring = False
+
+    @property
+    def usable(self) -> bool:
+        return not self.retiring and self.browser.is_connected()
+
+class BrowserPool:
+    """
+    Long-lived Chromium pool owned by the watcher process.
+    Each job leases its own isolated BrowserContext; browsers are capped at
+    `pages_per_browser` concurrent leases and recycled after `recycle_after`
+    jobs or as soon as they disconnect (crash).
+    """
+
+    def __init__(self, size: int = BROWSER_POOL_SIZE, pages_per_browser: int = PAGES_PER_BROWSER,
+                 recycle_after: int = BROWSER_RECYCLE_AFTER, headless: bool = True):
+        self.size = max(1, size)
+        self.pages_per_browser = max(1, pages_per_browser)
+        self.recycle_after = max(1, recycle_after)
+        self.headless = headless
+        self._playwright = None
+        self._browsers = []
+        self._cond = asyncio.Condition()
+        self._start_lock = asyncio.Lock()
+        self._closed = False
+
+    async def start(self):
+        # Concurrent first leases must not each start (and leak) a Playwright driver
+        async with self._start_lock:
+            if self._playwright is None:
+                # Imported on first lease so the watcher starts without loading Playwright
+                from playwright.async_api import async_playwright
+                self._playwright = await async_playwright().start()
+        return self
+
+    async def _launch(self) -> _PooledBrowser:
+        with metrics.span("browser_launch"):
+            browser = await self._playwright.chromium.launch(headless=self.headless)
+        print(f"    - Browser pool: launched Chromium ({len(self._browsers) + 1}/{self.size})", flush=True)
+        return _PooledBrowser(browser)
+
+    async def _acquire(self) -> _PooledBrowser:
+        async with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Browser pool is closed")
+                # Drop crashed browsers so their slot can be relaunched
+                for pb in [b for b in self._browsers if not b.browser.is_connected()]:
+                    print("    ! Browser pool: Chromium disconnected, replacing it.", flush=True)
+                    self._browsers.remove(pb)
+
+                candidates = [b for b in self._browsers if b.usable and b.active < self.pages_per_browser]
+                if candidates:
+                    pb = min(candidates, key=lambda b: b.active)
+                elif len(self._browsers) < self.size:
+                    pb = await self._launch()
+                    self._browsers.append(pb)
+                else:
+                    await self._cond.wait()
+                    continue
+                pb.active += 1
+                return pb
+
+    async def _release(self, pb: _PooledBrowser):
+        to_close = None
+        async with self._cond:
+            pb.active -= 1
+            pb.jobs += 1
+            if pb.jobs >= self.recycle_after:
+                pb.retiring = True
+            if (pb.retiring or not pb.browser.is_connected()) and pb.active == 0:
+                if pb in self._browsers:
+                    self._browsers.remove(pb)
+                to_close = pb
+            self._cond.notify_all()
+        if to_close is not None:
+            if to_close.retiring:
+                print(f"    - Browser pool: recycling Chromium after {to_close.jobs} jobs", flush=True)
+            try:
+                await to_close.browser.close()
+            except Exception:
+                pass
+
+    @asynccontextmanager
+    async def lease(self):
+        """Yields a fresh BrowserContext on a pooled browser."""
+        with metrics.span("browser_lease"):
+            await self.start()
+            pb = await self._acquire()
+        ctx = None
+        try:
+            with metrics.span("new_context"):
+                ctx = await pb.browser.new_context()
+            yield ctx
+        finally:
+            if ctx is not None:
+                try:
+                    await ctx.close()
+                except Exception:
+                    pass
+            await self._release(pb)
+
+    async def close(self):
+        async with self._cond:
+            self._closed = True
+            browsers, self._browsers = self._browsers, []
+            self._cond.notify_all()
+        for pb in browsers:
+            try:
+                await pb.browser.close()
+            except Exception:
+                pass
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
@@ -0,0 +1,78 @@
+import re
+from typing import Callable, List
+
+# Lines that start a new message in exports (**USER**:), scraped share pages
+# ("You said:", "ChatGPT said:") and plain pasted logs ("User:", "Assistant:").
+MESSAGE_START = re.compile(
+    r"^(?:\*\*[A-Z_]+\*\*:|# Conversation:|You said:?$|(?:ChatGPT|Gemini|Claude) said:?$|"
+    r"(?:User|Assistant|Model|Human|AI):)",
+    re.MULTILINE,
+)
+
+def split_messages(content: str) -> List[str]:
+    """
+    Splits a log at message boundaries. Falls back to blank-line paragraphs
+    when no known speaker markers are present.
+    """
+    starts = [m.start() for m in MESSAGE_START.finditer(content)]
+    if len(starts) < 2:
+        return [p + "\n\n" for p in re.split(r"\n\s*\n", content) if p.strip()]
+    if starts[0] != 0:
+        starts.insert(0, 0)
+    starts.append(len(content))
+    return [content[a:b] for a, b in zip(starts, starts[1:]) if content[a:b].strip()]
+
+def _hard_split(message: str, max_tokens: int, count_tokens: Callable[[str], int]) -> List[str]:
+    """Splits a single oversized message on line boundaries (characters as a last resort)."""
+    pieces, current = [], ""
+    for line in message.splitlines(keepends=True):
+        while count_tokens(line) > max_tokens:
+            # Single enormous line: cut by the estimated characters per token
+            cut = max(1, len(line) * max_tokens // max(count_tokens(line), 1))
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(line[:cut])
+            line = line[cut:]
+        if current and count_tokens(current + line) > max_tokens:
+            pieces.append(current)
+            current = ""
+        current += line
+    if current:
+        pieces.append(current)
+    return pieces
+
+def chunk_messages(messages: List[str], max_tokens: int, overlap_tokens: int,
+                   count_tokens: Callable[[str], int]) -> List[str]:
+    """
+    Greedily packs whole messages into chunks of at most `max_tokens`.
+    Each chunk after the first starts with the trailing messages of the previous
+    one (up to `overlap_tokens`) so context carries across the cut.
+    """
+    units = []
+    for message in messages:
+        if count_tokens(message) > max_tokens:
+            units.extend(_hard_split(message, max_tokens, count_tokens))
+        else:
+            units.append(message)
+
+    chunks = []
+    current, current_tokens = [], 0
+    for unit in units:
+        unit_tokens = count_tokens(unit)
+        if current and current_tokens + unit_tokens > max_tokens:
+            chunks.append("".join(current))
+            # Carry the tail of this chunk into the next one
+            overlap, overlap_size = [], 0
+            for prev in reversed(current):
+                size = count_tokens(prev)
+                if overlap_size + size > overlap_tokens or overlap_size + size + unit_tokens > max_tokens:
+                    break
+                overlap.insert(0, prev)
+                overlap_size += size
+            current, current_tokens = overlap, overlap_size
+        current.append(unit)
+        current_tokens += unit_tokens
+    if current:
+        chunks.append("".join(current))
+    return chunks
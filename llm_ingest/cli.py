@@ -0,0 +1,275 @@
+import argparse
+import asyncio
+import glob
+import hashlib
+import sys
+import time
+from pathlib import Path
+from . import parser, analyzer, writer, batch, metrics, incremental
+from .browser_pool import BrowserPool
+from .config import SCRAPE_CONCURRENCY, ANALYZE_CONCURRENCY, WRITE_CONCURRENCY, ensure_dirs
+from .metrics import percentile
+
+def expand_inputs(specs: list) -> list:
+    """Resolves directories, globs and plain paths into a sorted, de-duplicated file list."""
+    files = []
+    for spec in specs:
+        path = Path(spec).expanduser()
+        if path.is_dir():
+            files.extend(p for p in sorted(path.iterdir()) if p.is_file() and not p.name.startswith('.'))
+        elif any(ch in spec for ch in "*?["):
+            files.extend(Path(p) for p in sorted(glob.glob(str(path), recursive=True)) if Path(p).is_file())
+        elif path.is_file():
+            files.append(path)
+        else:
+            print(f"  ! No such file, directory or glob match: {spec}", file=sys.stderr)
+    return list(dict.fromkeys(p.resolve() for p in files))
+
+def read_url_list(path: Path) -> list:
+    urls = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                urls.append(line)
+    return list(dict.fromkeys(urls))
+
+class RunStats:
+    """Counters and per-call LLM samples for the final throughput report."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.items = {"written": 0, "skipped": 0, "failed": 0}
+        self.notes = 0
+        self.calls = []
+
+    def on_call(self, record: dict):
+        self.calls.append(record)
+
+    def report(self, cache_stats: dict = None) -> str:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        finished = self.items["written"] + self.items["failed"]
+        latencies = [c["latency_s"] for c in self.calls if c["ok"]]
+        lines = [
+            "",
+            "=== Batch Report ===",
+            f"Items:      {self.items['written']} written, {self.items['skipped']} skipped, {self.items['failed']} failed",
+            f"Notes:      {self.notes}",
+            f"Elapsed:    {elapsed:.1f}s ({finished / elapsed:.2f} files/s)",
+            f"LLM calls:  {len(latencies)} ok, {len(self.calls) - len(latencies)} failed, "
+            f"{sum(c.get('retries', 0) for c in self.calls)} retried, {sum(bool(c.get('hedged')) for c in self.calls)} hedged",
+            f"Tokens:     {sum(c['prompt_tokens'] for c in self.calls)} prompt, "
+            f"{sum(c['output_tokens'] for c in self.calls)} output",
+            f"API latency p50={percentile(latencies, 50)}s p95={percentile(latencies, 95)}s "
+            f"p99={percentile(latencies, 99)}s max={round(max(latencies), 3) if latencies else 0.0}s",
+        ]
+        if cache_stats:
+            lines.append(f"LLM cache:  {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+        return "\n".join(lines)
+
+async def _analyze_and_write(content: str, staging_dir, name: str, sems: dict, analyze) -> tuple:
+    """Analyze and write stages of one item. Returns (note_path, pending update or None)."""
+    # A grown share link: only the appended messages are analyzed, into the existing note
+    update = await asyncio.to_thread(incremental.load_update, staging_dir)
+    async with sems["analyze"]:
+        with metrics.span("analyze", chars=len(content), update=bool(update)):
+            if update:
+                analysis = await analyzer.analyze_update_async(content, update['summary'])
+            else:
+                analysis = await analyze(content)
+    if analysis.get('topic') == analyzer.ERROR_TOPIC:
+        raise RuntimeError(analysis.get('solution_insight'))
+
+    async with sems["write"]:
+        with metrics.span("write"):
+            if update:
+                note_path = await writer.update_note_async(update['note_path'], analysis, staging_dir=staging_dir)
+            else:
+                note_path = await writer.write_note_async(analysis, original_source=name, staging_dir=staging_dir)
+    if staging_dir is not None:
+        await asyncio.to_thread(incremental.commit, staging_dir, note_path)
+    return note_path, update
+
+async def _process_item(kind: str, item, sems: dict, browser_pool, stats: RunStats, progress, analyze, analyze_jobs: int):
+    item_id = str(item)
+    name = item.name if kind == "file" else item
+    print(f"\n[BATCH] {name}", flush=True)
+    stage = lambda stage_name: sems[stage_name]
+
+    if kind == "file" and await asyncio.to_thread(batch.is_multi_conversation_export, item):
+        summary = await batch.run_split_export(
+            item, source_name=item.name, stage=stage, concurrency=analyze_jobs, analyze=analyze,
+        )
+        stats.notes += summary["written"]
+        if summary["failed"]:
+            raise RuntimeError(f"{summary['failed']} conversations failed")
+        progress.record(item_id, f"{summary['written']} notes")
+        return "written"
+
+    async with sems["scrape"]:
+        with metrics.span("parse"):
+            if kind == "file":
+                content, staging_dir = await parser.parse_file_async(item, browser_pool=browser_pool)
+            else:
+                content, staging_dir = await parser.parse_url_async(item, browser_pool=browser_pool)
+    if content is None or not content.strip():
+        return "skipped"
+
+    try:
+        note_path, update = await _analyze_and_write(content, staging_dir, name, sems, analyze)
+    except BaseException:
+        # Otherwise the URL's scrape claim makes the next run skip it as already processed
+        incremental.release(staging_dir)
+        raise
+    print(f"  [SUCCESS] Note {'updated' if update else 'created'}: {note_path}", flush=True)
+    stats.notes += 1
+    progress.record(item_id, note_path)
+    return "written"
+
+async def run_batch(args) -> int:
+    items = [("file", p) for p in expand_inputs(args.inputs)]
+    for url_file in args.urls or []:
+        items.extend(("url", u) for u in read_url_list(Path(url_file)))
+    if not items:
+        print("Nothing to process.")
+        return 1
+
+    # Progress is keyed by the exact input set, so reruns of the same command resume
+    run_key = hashlib.sha256("\n".join(str(i) for _, i in items).encode()).hexdigest()[:16]
+    progress = batch.BatchProgress(f"cli-{run_key}")
+    if not args.resume and progress.done:
+        progress.clear()
+        progress = batch.BatchProgress(f"cli-{run_key}")
+    todo = [(kind, item) for kind, item in items if str(item) not in progress.done]
+
+    print(f"Batch: {len(items)} inputs, {len(items) - len(todo)} already done, {len(todo)} to process")
+    if args.dry_run:
+        for kind, item in todo:
+            print(f"  - [{kind}] {item}")
+        return 0
+
+    stats = RunStats()
+    stats.items["skipped"] = len(items) - len(todo)
+    analyzer.add_call_listener(stats.on_call)
+    analyzer.add_call_listener(metrics.record_llm_call)
+    batcher = None
+    analyze = analyzer.analyze_content_async
+    jobs = args.jobs
+    if args.batch_api:
+        # Enough analyses in flight to fill a batch job
+        batcher = analyzer.BatchAnalyzer()
+        analyze = batcher.analyze
+        jobs = max(args.jobs, batcher.max_requests)
+        print(f"Using the Gemini Batch API (up to {batcher.max_requests} requests per job)")
+    sems = {
+        "scrape": asyncio.Semaphore(args.scrape_jobs),
+        "analyze": asyncio.Semaphore(jobs),
+        "write": asyncio.Semaphore(args.write_jobs),
+    }
+    # Chromium only launches if a share link actually needs scraping
+    browser_pool = BrowserPool()
+
+    # Bound in-flight items so huge backfills don't create every task up front
+    slots = asyncio.Semaphore(args.scrape_jobs + jobs + args.write_jobs)
+
+    async def guarded(kind, item):
+        try:
+            with metrics.trace(item.name if kind == "file" else item), metrics.span("job"):
+                outcome = await _process_item(kind, item, sems, browser_pool, stats, progress, analyze, jobs)
+            stats.items[outcome] += 1
+        except Exception as e:
+            stats.items["failed"] += 1
+            print(f"  [ERROR] {item}: {e}", flush=True)
+        finally:
+            slots.release()
+
+    tasks = []
+    try:
+        for kind, item in todo:
+            await slots.acquire()
+            tasks.append(asyncio.create_task(guarded(kind, item)))
+        await asyncio.gather(*tasks)
+    finally:
+        if batcher is not None:
+            await batcher.close()
+        analyzer.remove_call_listener(stats.on_call)
+        analyzer.remove_call_listener(metrics.record_llm_call)
+        await browser_pool.close()
+
+    cache_stats = None
+    try:
+        from .response_cache import get_response_cache
+        cache_stats = get_response_cache().stats()
+    except Exception:
+        pass
+    print(stats.report(cache_stats))
+    return 1 if stats.items["failed"] else 0
+
+async def run_reindex(args) -> int:
+    from .index import get_vault_index
+    index = get_vault_index()
+    stats = index.reindex(full=args.full)
+    print(
+        f"Indexed {stats['indexed']} notes, removed {stats['removed']}, "
+        f"{stats['notes']} in the vault ({stats['seconds']}s)"
+    )
+    return 0
+
+async def run_compact(args) -> int:
+    from .processed_store import get_processed_store
+    cleared = get_processed_store().compact()
+    print(f"Processed store compacted: {cleared} stale claims cleared")
+    return 0
+
+async def run_search(args) -> int:
+    from .index import get_vault_index
+    index = get_vault_index()
+    if not args.no_refresh:
+        # Cheap when nothing changed: one stat per note
+        index.reindex()
+    results = index.search(" ".join(args.query), limit=args.limit)
+    if not results:
+        print("No matches.")
+        return 1
+    for hit in results:
+        tags = f" [{', '.join(hit['tags'])}]" if hit['tags'] else ""
+        print(f"{hit['path']}\n  {hit['topic']}{tags}\n  {' '.join(hit['snippet'].split())}")
+    return 0
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(prog="python -m llm_ingest", description="XRay Synthesis ingest tools.")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    b = sub.add_parser("batch", help="Run parse -> analyze -> write over files, globs or URL lists.")
+    b.add_argument("inputs", nargs="*", help="Files, directories or glob patterns (quote globs).")
+    b.add_argument("--urls", action="append", metavar="FILE", help="File with one share link per line (repeatable).")
+    b.add_argument("-j", "--jobs", type=int, default=ANALYZE_CONCURRENCY, help="Concurrent LLM analyses.")
+    b.add_argument("--scrape-jobs", type=int, default=SCRAPE_CONCURRENCY, help="Concurrent parses/scrapes.")
+    b.add_argument("--write-jobs", type=int, default=WRITE_CONCURRENCY, help="Concurrent note writes.")
+    b.add_argument("--dry-run", action="store_true", help="List what would be processed and exit.")
+    b.add_argument("--batch-api", action="store_true",
+                   help="Analyze through Gemini batch jobs: cheaper, but results can take hours.")
+    b.add_argument("--resume", action="store_true", help="Skip inputs finished by a previous run of the same batch.")
+    b.set_defaults(func=run_batch)
+
+    s = sub.add_parser("search", help="Full-text search over the vault notes.")
+    s.add_argument("query", nargs="+", help='Words, "phrases" or FTS5 syntax, e.g. tags:sqlite or topic:cache.')
+    s.add_argument("-n", "--limit", type=int, default=20, help="Max results.")
+    s.add_argument("--no-refresh", action="store_true", help="Skip the incremental reindex before searching.")
+    s.set_defaults(func=run_search)
+
+    r = sub.add_parser("reindex", help="Bring the vault search index up to date (changed files by mtime).")
+    r.add_argument("--full", action="store_true", help="Re-read every note instead of only changed ones.")
+    r.set_defaults(func=run_reindex)
+
+    c = sub.add_parser("compact", help="Clear stale URL claims and vacuum the processed-links database.")
+    c.set_defaults(func=run_compact)
+    return ap
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    ensure_dirs()
+    try:
+        return asyncio.run(args.func(args))
+    except KeyboardInterrupt:
+        return 130
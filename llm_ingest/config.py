@@ -9,22 +9,121 @@ load_dotenv(Path(__file__).parent.parent / '.env')
 ANTHROPIC_API_KEY = os.getenv('ANTHROPIC_API_KEY')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+# Override the Gemini endpoint (e.g. a local stub server); unset uses Google's
+GEMINI_BASE_URL = os.getenv('GEMINI_BASE_URL')
 
 # Paths
-BASE_DIR = Path('/Users/mark/Documents/Code.nosync/Brain.Mark.Digital Posting Improvements') # Keeping path for now, but project is XRay Synthesis
+# XRAY_BASE_DIR / XRAY_VAULT_DIR relocate all state (the bench suite points them at a temp dir)
+BASE_DIR = Path(os.getenv('XRAY_BASE_DIR', '/Users/mark/Documents/Code.nosync/Brain.Mark.Digital Posting Improvements')) # Keeping path for now, but project is XRay Synthesis
 INGEST_DIR = BASE_DIR / 'Chat_Ingest'
 ARCHIVE_DIR = INGEST_DIR / 'archive'
 STAGING_DIR = BASE_DIR / 'llm_ingest' / 'scraped'
-VAULT_DIR = Path('/Users/mark/Documents/Code.nosync/pkm/1 - Rough Notes/AI Ingest')
+VAULT_DIR = Path(os.getenv('XRAY_VAULT_DIR', '/Users/mark/Documents/Code.nosync/pkm/1 - Rough Notes/AI Ingest'))
 ATTACHMENTS_DIR = VAULT_DIR.parent.parent / 'Resources' / 'AI_Attachments'
-PROCESSED_IDS_FILE = BASE_DIR / 'llm_ingest' / 'processed_ids.json'
-
-# Ensure directories exist
-INGEST_DIR.mkdir(parents=True, exist_ok=True)
-ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
-STAGING_DIR.mkdir(parents=True, exist_ok=True)
-VAULT_DIR.mkdir(parents=True, exist_ok=True)
-ATTACHMENTS_DIR.mkdir(parents=True, exist_ok=True)
+PROCESSED_IDS_FILE = BASE_DIR / 'llm_ingest' / 'processed_ids.json'  # legacy, imported once
+PROCESSED_DB_FILE = BASE_DIR / 'llm_ingest' / 'processed_ids.db'
+BATCH_PROGRESS_DIR = BASE_DIR / 'llm_ingest' / 'batches'  # resume state for split exports
+MODEL_CACHE_FILE = BASE_DIR / 'llm_ingest' / 'model_cache.json'
+LLM_CACHE_FILE = BASE_DIR / 'llm_ingest' / 'llm_cache.db'
+JOURNAL_FILE = BASE_DIR / 'llm_ingest' / 'jobs.db'
+JOB_STATE_DIR = BASE_DIR / 'llm_ingest' / 'jobs'  # parsed content kept between stages
+METRICS_LOG_FILE = BASE_DIR / 'llm_ingest' / 'metrics.jsonl'  # per-job spans and LLM calls
+VAULT_INDEX_FILE = BASE_DIR / 'llm_ingest' / 'vault_index.db'  # FTS5 index over the notes in VAULT_DIR
+
+def ensure_dirs():
+    """Creates the working directories. Called by entry points, not at import."""
+    for d in (INGEST_DIR, ARCHIVE_DIR, STAGING_DIR, BATCH_PROGRESS_DIR, VAULT_DIR, ATTACHMENTS_DIR):
+        d.mkdir(parents=True, exist_ok=True)
+
+# Watcher Scheduler
+# Per-stage concurrency limits. Scraping launches Chromium, so keep it low.
+SCRAPE_CONCURRENCY = int(os.getenv('SCRAPE_CONCURRENCY', '2'))
+ANALYZE_CONCURRENCY = int(os.getenv('ANALYZE_CONCURRENCY', '4'))
+WRITE_CONCURRENCY = int(os.getenv('WRITE_CONCURRENCY', '2'))
+# Max queued files; further submissions wait for a free slot (backpressure)
+INGEST_QUEUE_SIZE = int(os.getenv('INGEST_QUEUE_SIZE', '500'))
+# Write-completion detection: a file is ready once size/mtime hold for this long
+WRITE_STABLE_SECONDS = float(os.getenv('WRITE_STABLE_SECONDS', '2'))
+WRITE_POLL_INTERVAL = float(os.getenv('WRITE_POLL_INTERVAL', '0.1'))
+# Below this size one quiet poll is enough
+SMALL_FILE_BYTES = int(os.getenv('SMALL_FILE_BYTES', str(1024 * 1024)))
+# Seconds between queue/in-flight metric reports while busy
+METRICS_REPORT_INTERVAL = float(os.getenv('METRICS_REPORT_INTERVAL', '10'))
+# Structured metrics: JSON-lines span log plus a local Prometheus /metrics endpoint (port 0 disables)
+METRICS_LOG_ENABLED = os.getenv('METRICS_LOG_ENABLED', '1') == '1'
+METRICS_LOG_MAX_BYTES = int(os.getenv('METRICS_LOG_MAX_BYTES', str(50 * 1024 * 1024)))
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9464'))
+
+# Split multi-conversation ChatGPT exports into one note per conversation
+SPLIT_EXPORTS = os.getenv('SPLIT_EXPORTS', '1') == '1'
+# Re-dropped share links are re-scraped; only newly appended messages are analyzed
+# and added to the existing note
+INCREMENTAL_REINGEST = os.getenv('INCREMENTAL_REINGEST', '1') == '1'
+# Characters of the existing note sent as context with an incremental update
+INCREMENTAL_CONTEXT_CHARS = int(os.getenv('INCREMENTAL_CONTEXT_CHARS', '2000'))
+# Shared Gemini request budget across all jobs
+LLM_REQUESTS_PER_MINUTE = float(os.getenv('LLM_REQUESTS_PER_MINUTE', '60'))
+# Prompt tokens per minute across all jobs (0 disables the token budget)
+LLM_TOKENS_PER_MINUTE = float(os.getenv('LLM_TOKENS_PER_MINUTE', '1000000'))
+# Max Gemini requests in flight at once, hedges included
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+# Retries for 429/5xx/timeouts with jittered backoff: random(0, min(max, base * 2^attempt))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '4'))
+LLM_RETRY_BASE = float(os.getenv('LLM_RETRY_BASE', '2'))
+LLM_RETRY_MAX = float(os.getenv('LLM_RETRY_MAX', '60'))
+LLM_REQUEST_TIMEOUT = float(os.getenv('LLM_REQUEST_TIMEOUT', '300'))
+# Hedged requests: send a duplicate once a call outlives the model's p95 latency
+LLM_HEDGE = os.getenv('LLM_HEDGE', '0') == '1'
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv('LLM_HEDGE_MIN_SAMPLES', '20'))
+# Gemini model discovery cache
+MODEL_CACHE_TTL = float(os.getenv('MODEL_CACHE_TTL', str(6 * 3600)))
+# Seconds to skip a model after a quota (429) error
+MODEL_QUOTA_BACKOFF = float(os.getenv('MODEL_QUOTA_BACKOFF', '60'))
+# Content-addressed analysis cache
+LLM_CACHE_MAX_BYTES = int(os.getenv('LLM_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+LLM_CACHE_BYPASS = os.getenv('LLM_CACHE_BYPASS', '0') == '1'
+
+# Token budgeting for analysis. Logs over the budget go through map-reduce.
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '175000'))
+CHUNK_TOKENS = int(os.getenv('CHUNK_TOKENS', '60000'))
+CHUNK_OVERLAP_TOKENS = int(os.getenv('CHUNK_OVERLAP_TOKENS', '2000'))
+# Fallback estimate when the count_tokens API is unavailable
+CHARS_PER_TOKEN = float(os.getenv('CHARS_PER_TOKEN', '4'))
+# Only logs estimated above this fraction of the budget get an exact count_tokens call
+EXACT_COUNT_THRESHOLD = float(os.getenv('EXACT_COUNT_THRESHOLD', '0.8'))
+MAP_CONCURRENCY = int(os.getenv('MAP_CONCURRENCY', '4'))
+
+# Gemini Batch API (opt-in for backfills: python -m llm_ingest batch --batch-api)
+# A job is submitted when this many prompts / bytes are pending (inline limit is 20MB)
+BATCH_MAX_REQUESTS = int(os.getenv('BATCH_MAX_REQUESTS', '100'))
+BATCH_MAX_BYTES = int(os.getenv('BATCH_MAX_BYTES', str(15 * 1024 * 1024)))
+# ...or this long after the last prompt arrived
+BATCH_LINGER_SECONDS = float(os.getenv('BATCH_LINGER_SECONDS', '5'))
+BATCH_POLL_INTERVAL = float(os.getenv('BATCH_POLL_INTERVAL', '30'))
+# Jobs still running after this are cancelled (the API's own limit is 48h)
+BATCH_TIMEOUT = float(os.getenv('BATCH_TIMEOUT', str(24 * 3600)))
+
+# Parallel image hashing/copies per note
+ATTACHMENT_COPY_WORKERS = int(os.getenv('ATTACHMENT_COPY_WORKERS', '8'))
+
+# Scraped image budgets (per page)
+PAGE_IMAGE_MAX_COUNT = int(os.getenv('PAGE_IMAGE_MAX_COUNT', '200'))
+PAGE_IMAGE_MAX_BYTES = int(os.getenv('PAGE_IMAGE_MAX_BYTES', str(100 * 1024 * 1024)))
+IMAGE_MAX_BYTES = int(os.getenv('IMAGE_MAX_BYTES', str(15 * 1024 * 1024)))
+# Images whose larger side is below this many pixels are treated as pixels/icons
+MIN_IMAGE_DIMENSION = int(os.getenv('MIN_IMAGE_DIMENSION', '48'))
+
+# Retry policy for failed jobs (.error files): base * 2^(attempt-1), capped
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '5'))
+JOB_RETRY_BASE = float(os.getenv('JOB_RETRY_BASE', '60'))
+JOB_RETRY_MAX = float(os.getenv('JOB_RETRY_MAX', '3600'))
+
+# Browser Pool (shared Chromium for share-link scraping)
+BROWSER_POOL_SIZE = int(os.getenv('BROWSER_POOL_SIZE', '1'))
+PAGES_PER_BROWSER = int(os.getenv('PAGES_PER_BROWSER', str(SCRAPE_CONCURRENCY)))
+# Relaunch a browser after this many jobs to cap memory growth
+BROWSER_RECYCLE_AFTER = int(os.getenv('BROWSER_RECYCLE_AFTER', '50'))
 
 # 2026 Model Selection
 # Using Claude Sonnet 4.5 (200k Context)
@@ -0,0 +1,153 @@
+import asyncio
+import hashlib
+import struct
+from pathlib import Path
+from .config import PAGE_IMAGE_MAX_BYTES, PAGE_IMAGE_MAX_COUNT, IMAGE_MAX_BYTES, MIN_IMAGE_DIMENSION
+
+IMAGE_CT_PREFIX = "image/"
+# Bodies smaller than this are almost always spacers/icons
+MIN_IMAGE_BYTES = 1000
+
+def _safe_ext(content_type: str) -> str:
+    ct = (content_type or "").split(";")[0].strip().lower()
+    return {
+        "image/jpeg": ".jpg",
+        "image/png": ".png",
+        "image/webp": ".webp",
+        "image/gif": ".gif",
+        "image/svg+xml": ".svg",
+    }.get(ct, "")
+
+def image_dimensions(data: bytes):
+    """
+    Reads (width, height) from PNG, GIF, JPEG or WebP headers.
+    Returns None for formats we can't decode (e.g. SVG).
+    """
+    try:
+        if data[:8] == b"\x89PNG\r\n\x1a\n":
+            return struct.unpack(">II", data[16:24])
+        if data[:6] in (b"GIF87a", b"GIF89a"):
+            return struct.unpack("<HH", data[6:10])
+        if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+            chunk = data[12:16]
+            if chunk == b"VP8 ":
+                w, h = struct.unpack("<HH", data[26:30])
+                return w & 0x3FFF, h & 0x3FFF
+            if chunk == b"VP8L":
+                bits = int.from_bytes(data[21:25], "little")
+                return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            if chunk == b"VP8X":
+                return int.from_bytes(data[24:27], "little") + 1, int.from_bytes(data[27:30], "little") + 1
+            return None
+        if data[:2] == b"\xff\xd8":
+            i = 2
+            while i + 9 < len(data):
+                if data[i] != 0xFF:
+                    i += 1
+                    continue
+                marker = data[i + 1]
+                # SOFn frames carry the dimensions (C4/C8/CC are not frames)
+                if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                    h, w = struct.unpack(">HH", data[i + 5:i + 9])
+                    return w, h
+                if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+                    i += 2
+                    continue
+                i += 2 + struct.unpack(">H", data[i + 2:i + 4])[0]
+    except struct.error:
+        pass
+    return None
+
+def _write_file(path: Path, body: bytes):
+    tmp = path.with_name(f".{path.name}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(body)
+    tmp.replace(path)
+
+class ImageCapture:
+    """
+    Per-page image pipeline for the scraper's response hook.
+    Dedups by content hash (so CDN variants of one image are stored once),
+    drops tracking pixels by decoded size, enforces per-page byte/count budgets
+    and writes files on worker threads so the event loop never blocks on disk.
+    """
+
+    def __init__(self, img_dir: Path, max_bytes: int = PAGE_IMAGE_MAX_BYTES, max_count: int = PAGE_IMAGE_MAX_COUNT):
+        self.img_dir = img_dir
+        self.max_bytes = max_bytes
+        self.max_count = max_count
+        self.hashes = set()
+        self.bytes_saved = 0
+        self._pending = set()
+        self.stats = {
+            "seen": 0, "saved": 0, "bytes_saved": 0,
+            "duplicate": 0, "tracking": 0, "too_small": 0,
+            "too_large": 0, "over_budget": 0, "errors": 0,
+        }
+
+    def _budget_left(self) -> bool:
+        return self.stats["saved"] < self.max_count and self.bytes_saved < self.max_bytes
+
+    async def on_response(self, resp):
+        try:
+            ct = (resp.headers.get("content-type") or "").lower()
+            if not ct.startswith(IMAGE_CT_PREFIX):
+                return
+            self.stats["seen"] += 1
+            if not self._budget_left():
+                self.stats["over_budget"] += 1
+                return
+
+            # Skip oversized bodies before pulling them into memory
+            length = int(resp.headers.get("content-length") or 0)
+            if length > IMAGE_MAX_BYTES:
+                self.stats["too_large"] += 1
+                return
+
+            body = await resp.body()
+            if not body or len(body) < MIN_IMAGE_BYTES:
+                self.stats["too_small"] += 1
+                return
+            if len(body) > IMAGE_MAX_BYTES:
+                self.stats["too_large"] += 1
+                return
+
+            dims = image_dimensions(body[:65536])
+            if dims and max(dims) < MIN_IMAGE_DIMENSION:
+                self.stats["tracking"] += 1
+                return
+
+            digest = hashlib.sha256(body).hexdigest()
+            if digest in self.hashes:
+                self.stats["duplicate"] += 1
+                return
+            # Check and reserve budget with no await in between
+            if not self._budget_left() or self.bytes_saved + len(body) > self.max_bytes:
+                self.stats["over_budget"] += 1
+                return
+            self.hashes.add(digest)
+            self.bytes_saved += len(body)
+            self.stats["saved"] += 1
+            self.stats["bytes_saved"] = self.bytes_saved
+
+            path = self.img_dir / f"{digest[:16]}{_safe_ext(ct) or '.img'}"
+            if path.exists():
+                return
+            task = asyncio.create_task(asyncio.to_thread(_write_file, path, body))
+            self._pending.add(task)
+            task.add_done_callback(self._write_done)
+        except Exception:
+            self.stats["errors"] += 1
+
+    def _write_done(self, task):
+        self._pending.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.stats["errors"] += 1
+
+    async def drain(self):
+        """Waits for queued writes to land on disk."""
+        while self._pending:
+            await asyncio.gather(*list(self._pending), return_exceptions=True)
+
+    def summary(self) -> dict:
+        return dict(self.stats)
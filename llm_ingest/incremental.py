@@ -0,0 +1,121 @@
+import json
+import os
+import re
+import shutil
+from difflib import SequenceMatcher
+from pathlib import Path
+from .config import INCREMENTAL_CONTEXT_CHARS
+from .chunker import split_messages
+from .processed_store import get_processed_store
+
+# Per-URL staging files (STAGING_DIR/<url_hash>/): the page text the note reflects,
+# and the pending update while an incremental job is in flight
+BASELINE_FILE = "page.base.txt"
+UPDATE_FILE = "update.json"
+
+# Note sections worth sending back as context; the blog post and artifacts are skipped
+SUMMARY_SECTIONS = re.compile(r"^#{1,3} (?:Context|The Solution|Update\b.*)$")
+
+def _body(page_text: str) -> str:
+    """page.txt minus its TITLE:/URL: header."""
+    header, sep, body = page_text.partition("\n\n")
+    return body if sep and header.startswith("TITLE:") else page_text
+
+def appended_messages(previous: str, current: str) -> list:
+    """
+    Messages in `current` after the last one it shares with `previous`.
+    Diffs at message granularity, so page chrome that moved (a footer that
+    trailed the old last message) costs at most one re-sent message.
+    """
+    old, new = split_messages(_body(previous)), split_messages(_body(current))
+    # Page chrome after the conversation ("Sign in", disclaimers) is a unit of its own in
+    # paragraph mode and identical on both pages; it must not anchor the diff
+    tail = 0
+    while tail < min(len(old), len(new)) and old[-1 - tail] == new[-1 - tail]:
+        tail += 1
+    old, new = old[:len(old) - tail], new[:len(new) - tail]
+    blocks = [b for b in SequenceMatcher(None, old, new, autojunk=False).get_matching_blocks() if b.size]
+    if not blocks:
+        return new
+    last = blocks[-1]
+    return new[last.b + last.size:]
+
+def note_summary(note_path: Path, max_chars: int = INCREMENTAL_CONTEXT_CHARS) -> str:
+    """
+    Compact context from an existing note: title, tags and the Context /
+    Solution / Update sections, each trimmed. No LLM call.
+    """
+    text = note_path.read_text(encoding="utf-8")
+    tags = re.search(r"^tags: \[(.*)\]$", text, re.MULTILINE)
+    lines, keep = [], False
+    for line in text.splitlines():
+        if line.startswith("# "):
+            lines.append(line)
+        elif line.startswith("#"):
+            keep = bool(SUMMARY_SECTIONS.match(line))
+            if keep:
+                lines.append(line)
+        elif keep and line.strip():
+            lines.append(line[:400])
+    if tags:
+        lines.insert(1, f"Tags: {tags.group(1)}")
+    summary = "\n".join(lines)
+    return summary if len(summary) <= max_chars else summary[:max_chars] + "\n[...]"
+
+def can_update(url_hash: str, staging_dir: Path) -> bool:
+    """True when a URL has a note and a baseline page to diff against."""
+    note_path = get_processed_store().get_note_path(url_hash)
+    return note_path is not None and note_path.exists() and (staging_dir / BASELINE_FILE).exists()
+
+def prepare_update(url_hash: str, staging_dir: Path):
+    """
+    Diffs the fresh page.txt against the baseline. Returns the appended messages
+    as text (and records the pending update), or None when nothing is new.
+    """
+    previous = (staging_dir / BASELINE_FILE).read_text(encoding="utf-8")
+    current = (staging_dir / "page.txt").read_text(encoding="utf-8")
+    new_messages = appended_messages(previous, current)
+    if not new_messages:
+        (staging_dir / UPDATE_FILE).unlink(missing_ok=True)
+        return None
+    note_path = get_processed_store().get_note_path(url_hash)
+    delta = "".join(new_messages)
+    update = {"note_path": str(note_path), "summary": note_summary(note_path), "messages": len(new_messages)}
+    with open(staging_dir / UPDATE_FILE, "w", encoding="utf-8") as f:
+        json.dump(update, f)
+    print(
+        f"    - Incremental: {len(new_messages)} new messages ({len(delta)} of {len(_body(current))} chars) "
+        f"for {note_path.name}"
+    )
+    return delta
+
+def load_update(staging_dir: Path):
+    """The pending update for a staging dir ({note_path, summary, messages}), or None for a new note."""
+    if staging_dir is None:
+        return None
+    try:
+        with open(Path(staging_dir) / UPDATE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def commit(staging_dir: Path, note_path: Path):
+    """
+    After a note is written or updated: the scraped page becomes the new
+    baseline and the URL (staging dirs are named by URL hash) is marked done,
+    mapped to the note. Until then the URL only holds its scrape claim.
+    """
+    staging_dir = Path(staging_dir)
+    page = staging_dir / "page.txt"
+    if not page.exists():
+        return
+    tmp = staging_dir / f".{BASELINE_FILE}.{os.getpid()}.tmp"
+    shutil.copyfile(page, tmp)
+    os.replace(tmp, staging_dir / BASELINE_FILE)
+    (staging_dir / UPDATE_FILE).unlink(missing_ok=True)
+    get_processed_store().mark_done(staging_dir.name, note_path)
+
+def release(staging_dir: Path):
+    """Drops the scrape claim of a URL whose analysis or write failed, so a later run retries it."""
+    if staging_dir is not None:
+        get_processed_store().release(Path(staging_dir).name)
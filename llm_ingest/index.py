@@ -0,0 +1,213 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from .config import VAULT_DIR, VAULT_INDEX_FILE
+
+FRONTMATTER = re.compile(r"\A---\n(.*?)\n---\n", re.DOTALL)
+# bm25 weights for topic, tags, source, body
+RANK_WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+
+def parse_note(text: str) -> dict:
+    """Topic, tags, source and body of a vault note (frontmatter as written by writer.render_note)."""
+    meta, body = {}, text
+    match = FRONTMATTER.match(text)
+    if match:
+        body = text[match.end():]
+        for line in match.group(1).splitlines():
+            key, sep, value = line.partition(":")
+            if sep:
+                meta[key.strip()] = value.strip()
+    topic = re.search(r"^# (.+)$", body, re.MULTILINE)
+    tags = meta.get("tags", "").strip("[]")
+    return {
+        "topic": topic.group(1).strip() if topic else "",
+        "tags": " ".join(t.strip() for t in tags.split(",") if t.strip()),
+        "source": meta.get("source", ""),
+        "body": body,
+    }
+
+def _fts_phrases(query: str) -> str:
+    """Plain-text fallback for queries that aren't valid FTS5 syntax: every word as a quoted term."""
+    return " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+
+class VaultIndex:
+    """
+    SQLite FTS5 index over the markdown notes in the vault: topic, tags, source
+    and body. The writer keeps it current as notes are written; reindex()
+    catches up with edits made elsewhere (e.g. in Obsidian) by mtime and size,
+    so only changed files are read. Paths are stored relative to the vault, which
+    also lets the writer check name collisions without probing the filesystem.
+    """
+
+    def __init__(self, db_path: Path = VAULT_INDEX_FILE, vault_dir: Path = VAULT_DIR):
+        self.vault_dir = Path(vault_dir)
+        self._lock = threading.Lock()
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(db_path), timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS notes ("
+            " id INTEGER PRIMARY KEY,"
+            " path TEXT UNIQUE NOT NULL,"
+            " mtime REAL NOT NULL,"
+            " size INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5("
+            " topic, tags, source, body, tokenize = 'porter unicode61')"
+        )
+
+    def _relative(self, path: Path):
+        try:
+            return Path(path).resolve().relative_to(self.vault_dir.resolve()).as_posix()
+        except ValueError:
+            return None
+
+    def _upsert(self, rel: str, text: str, mtime: float, size: int):
+        row = self._conn.execute("SELECT id FROM notes WHERE path = ?", (rel,)).fetchone()
+        if row:
+            note_id = row[0]
+            self._conn.execute("UPDATE notes SET mtime = ?, size = ? WHERE id = ?", (mtime, size, note_id))
+            self._conn.execute("DELETE FROM notes_fts WHERE rowid = ?", (note_id,))
+        else:
+            note_id = self._conn.execute(
+                "INSERT INTO notes (path, mtime, size) VALUES (?, ?, ?)", (rel, mtime, size)
+            ).lastrowid
+        note = parse_note(text)
+        self._conn.execute(
+            "INSERT INTO notes_fts (rowid, topic, tags, source, body) VALUES (?, ?, ?, ?, ?)",
+            (note_id, note["topic"], note["tags"], note["source"], note["body"]),
+        )
+
+    def _delete(self, rel: str):
+        row = self._conn.execute("SELECT id FROM notes WHERE path = ?", (rel,)).fetchone()
+        if row:
+            self._conn.execute("DELETE FROM notes_fts WHERE rowid = ?", (row[0],))
+            self._conn.execute("DELETE FROM notes WHERE id = ?", (row[0],))
+
+    def add(self, path: Path, content: str = None):
+        """Indexes (or re-indexes) one note; files outside the vault are ignored."""
+        rel = self._relative(path)
+        if rel is None:
+            return
+        st = os.stat(path)
+        if content is None:
+            content = Path(path).read_text(encoding="utf-8")
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._upsert(rel, content, st.st_mtime, st.st_size)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def remove(self, path: Path):
+        rel = self._relative(path)
+        if rel is None:
+            return
+        with self._lock:
+            self._delete(rel)
+
+    def taken_names(self, base_path: Path) -> set:
+        """
+        Indexed note names in base_path's folder that start with its stem, i.e.
+        every 'Title.md' / 'Title (n).md' a new note could collide with.
+        """
+        rel = self._relative(base_path.parent)
+        if rel is None:
+            return set()
+        prefix = base_path.stem if rel == "." else f"{rel}/{base_path.stem}"
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path FROM notes WHERE path >= ? AND path < ?", (prefix, prefix + "\U0010ffff")
+            ).fetchall()
+        return {Path(row[0]).name for row in rows}
+
+    def search(self, query: str, limit: int = 20) -> list:
+        """
+        Ranked full-text search (bm25, topic and tags weighted highest).
+        Accepts FTS5 syntax, e.g. `tags:sqlite`, `"exact phrase"`, `cache NOT redis`;
+        anything that doesn't parse is searched as plain words.
+        """
+        sql = (
+            "SELECT n.path, f.topic, f.tags, snippet(notes_fts, 3, '[', ']', ' ... ', 12) AS snippet,"
+            f" bm25(notes_fts, {', '.join(map(str, RANK_WEIGHTS))}) AS rank"
+            " FROM notes_fts f JOIN notes n ON n.id = f.rowid"
+            " WHERE notes_fts MATCH ? ORDER BY rank LIMIT ?"
+        )
+        with self._lock:
+            try:
+                rows = self._conn.execute(sql, (query, limit)).fetchall()
+            except sqlite3.OperationalError:
+                rows = self._conn.execute(sql, (_fts_phrases(query), limit)).fetchall()
+        return [
+            {"path": self.vault_dir / path, "topic": topic, "tags": tags.split(), "snippet": snippet, "rank": rank}
+            for path, topic, tags, snippet, rank in rows
+        ]
+
+    def reindex(self, full: bool = False) -> dict:
+        """
+        Brings the index in line with the vault: new or changed notes (by mtime
+        and size) are read and indexed, deleted ones dropped. `full` re-reads everything.
+        """
+        started = time.monotonic()
+        vault = self.vault_dir.resolve()
+        on_disk = {}
+        for root, dirs, files in os.walk(vault):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for name in files:
+                if name.endswith('.md') and not name.startswith('.'):
+                    path = Path(root) / name
+                    st = path.stat()
+                    on_disk[path.relative_to(vault).as_posix()] = (path, st.st_mtime, st.st_size)
+
+        with self._lock:
+            known = {row[0]: (row[1], row[2]) for row in self._conn.execute("SELECT path, mtime, size FROM notes")}
+            changed = [rel for rel, (_, mtime, size) in on_disk.items() if full or known.get(rel) != (mtime, size)]
+            removed = [rel for rel in known if rel not in on_disk]
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for rel in removed:
+                    self._delete(rel)
+                for rel in changed:
+                    path, mtime, size = on_disk[rel]
+                    try:
+                        text = path.read_text(encoding="utf-8")
+                    except (OSError, UnicodeDecodeError) as e:
+                        print(f"  ! Skipping {rel}: {e}", flush=True)
+                        continue
+                    self._upsert(rel, text, mtime, size)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return {
+            "notes": len(on_disk),
+            "indexed": len(changed),
+            "removed": len(removed),
+            "seconds": round(time.monotonic() - started, 3),
+        }
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_vault_index() -> VaultIndex:
+    """Process-wide vault index, opened on first use."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = VaultIndex()
+        return _index
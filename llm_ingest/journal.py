@@ -0,0 +1,184 @@
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from .config import JOURNAL_FILE, JOB_STATE_DIR, JOB_MAX_ATTEMPTS, JOB_RETRY_BASE, JOB_RETRY_MAX
+
+# Stages in pipeline order; a job's `stage` is the last one it completed
+STAGES = ("locked", "parsed", "analyzed", "written", "archived")
+
+class JobJournal:
+    """
+    Durable per-file job log (SQLite, WAL).
+    Each stage is recorded as it completes, together with what later stages need
+    (parsed content on disk, the analysis JSON, the note path), so a crashed or
+    failed job resumes from its last completed stage without re-scraping or
+    re-calling the LLM. Failed jobs are retried with exponential backoff.
+
+    status: active (in progress or crashed), error (waiting for retry),
+    done (archived, or stage 'skipped' for duplicates/empty files), dead (out of retries).
+
+    A job owns one source file, identified by name and inode (stable across the
+    .processing / .error renames), so a new file dropped under the same name
+    never resumes an older job's stages.
+    """
+
+    def __init__(self, db_path: Path = JOURNAL_FILE, state_dir: Path = JOB_STATE_DIR):
+        self.state_dir = Path(state_dir)
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_path), timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " name TEXT NOT NULL,"
+            " stage TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " next_retry_at REAL,"
+            " staging_dir TEXT,"
+            " content_file TEXT,"
+            " analysis TEXT,"
+            " note_path TEXT,"
+            " inode INTEGER,"
+            " error TEXT,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "inode" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN inode INTEGER")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_name ON jobs (name, status)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_retry ON jobs (status, next_retry_at)")
+
+    def _one(self, sql: str, args=()):
+        row = self._conn.execute(sql, args).fetchone()
+        return dict(row) if row else None
+
+    def get(self, job_id: int) -> dict:
+        with self._lock:
+            return self._one("SELECT * FROM jobs WHERE id = ?", (job_id,))
+
+    def _owner(self, name: str, inode: int):
+        # Jobs journaled before inodes were recorded match by name alone
+        return self._one(
+            "SELECT * FROM jobs WHERE name = ? AND status IN ('active', 'error') AND (inode = ? OR inode IS NULL)"
+            " ORDER BY inode IS NULL, id DESC LIMIT 1",
+            (name, inode),
+        )
+
+    def owner(self, name: str, inode: int) -> dict:
+        """The unfinished job that owns this file, or None."""
+        with self._lock:
+            return self._owner(name, inode)
+
+    def open_job(self, name: str, inode: int, resume: bool = True) -> dict:
+        """
+        Returns the unfinished job that owns this file (when `resume`), else
+        creates one at 'locked'. Fresh drops pass resume=False: whatever job
+        shares their name belongs to a different file.
+        """
+        now = time.time()
+        with self._lock:
+            job = self._owner(name, inode) if resume else None
+            if job:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'active', inode = ?, updated_at = ? WHERE id = ?", (inode, now, job["id"])
+                )
+                job.update(status="active", inode=inode)
+                return job
+            cur = self._conn.execute(
+                "INSERT INTO jobs (name, stage, status, inode, created_at, updated_at)"
+                " VALUES (?, 'locked', 'active', ?, ?, ?)",
+                (name, inode, now, now),
+            )
+            return self._one("SELECT * FROM jobs WHERE id = ?", (cur.lastrowid,))
+
+    def advance(self, job: dict, stage: str, **fields):
+        """Records a completed stage plus any artifacts it produced."""
+        allowed = {"staging_dir", "content_file", "analysis", "note_path"}
+        updates = {k: v for k, v in fields.items() if k in allowed}
+        if "analysis" in updates and not isinstance(updates["analysis"], str):
+            updates["analysis"] = json.dumps(updates["analysis"])
+        updates = {k: (str(v) if isinstance(v, Path) else v) for k, v in updates.items()}
+        sets = "".join(f", {k} = ?" for k in updates)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET stage = ?, updated_at = ?{sets} WHERE id = ?",
+                (stage, time.time(), *updates.values(), job["id"]),
+            )
+        job.update(fields, stage=stage)
+
+    def finish(self, job: dict, stage: str = "archived"):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET stage = ?, status = 'done', error = NULL, updated_at = ? WHERE id = ?",
+                (stage, time.time(), job["id"]),
+            )
+        self.discard_content(job)
+
+    def fail(self, job: dict, error: str) -> dict:
+        """Schedules a retry with exponential backoff, or gives up after JOB_MAX_ATTEMPTS."""
+        attempts = job.get("attempts", 0) + 1
+        if attempts >= JOB_MAX_ATTEMPTS:
+            status, next_retry_at = "dead", None
+        else:
+            status = "error"
+            next_retry_at = time.time() + min(JOB_RETRY_BASE * 2 ** (attempts - 1), JOB_RETRY_MAX)
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = ?, next_retry_at = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, attempts, next_retry_at, error, time.time(), job["id"]),
+            )
+        job.update(status=status, attempts=attempts, next_retry_at=next_retry_at, error=error)
+        return job
+
+    def register_error(self, name: str, inode: int, error: str = "found on startup") -> dict:
+        """Adopts a stray .error file that has no journal entry yet."""
+        job = self.open_job(name, inode, resume=False)
+        return self.fail(job, error)
+
+    def incomplete(self) -> list:
+        """Jobs that were in progress when the process died."""
+        with self._lock:
+            return [dict(r) for r in self._conn.execute("SELECT * FROM jobs WHERE status = 'active' ORDER BY id")]
+
+    def due_retries(self, now: float = None) -> list:
+        now = time.time() if now is None else now
+        with self._lock:
+            return [dict(r) for r in self._conn.execute(
+                "SELECT * FROM jobs WHERE status = 'error' AND next_retry_at <= ? ORDER BY next_retry_at", (now,)
+            )]
+
+    # Parsed content is kept on disk between stages so it survives restarts
+
+    def save_content(self, job: dict, content: str) -> Path:
+        path = self.state_dir / f"{job['id']}.txt"
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(content)
+        tmp.replace(path)
+        return path
+
+    def load_content(self, job: dict) -> str:
+        with open(job["content_file"], "r", encoding="utf-8") as f:
+            return f.read()
+
+    def load_analysis(self, job: dict) -> dict:
+        analysis = job["analysis"]
+        return json.loads(analysis) if isinstance(analysis, str) else analysis
+
+    def discard_content(self, job: dict):
+        if job.get("content_file"):
+            Path(job["content_file"]).unlink(missing_ok=True)
+
+_journal = None
+
+def get_journal() -> JobJournal:
+    global _journal
+    if _journal is None:
+        _journal = JobJournal()
+    return _journal
@@ -0,0 +1,190 @@
+import asyncio
+import math
+import random
+import re
+from collections import deque
+from .config import (
+    CHARS_PER_TOKEN, LLM_MAX_CONCURRENCY, LLM_MAX_RETRIES, LLM_RETRY_BASE, LLM_RETRY_MAX,
+    LLM_REQUEST_TIMEOUT, LLM_HEDGE, LLM_HEDGE_MIN_SAMPLES,
+)
+from .metrics import percentile
+from .ratelimit import get_llm_limiter, get_token_limiter
+
+# Transient server-side failures worth retrying
+RETRYABLE_CODES = {429, 500, 502, 503, 504}
+
+class LLMUnavailableError(RuntimeError):
+    """Gemini kept failing with transient errors (quota, 5xx, timeouts) after all retries."""
+
+def error_code(e: Exception):
+    code = getattr(e, "code", None) or getattr(e, "status_code", None)
+    if isinstance(code, int):
+        return code
+    text = str(e)
+    if "NOT_FOUND" in text or "404" in text:
+        return 404
+    if "RESOURCE_EXHAUSTED" in text or "429" in text:
+        return 429
+    if "UNAVAILABLE" in text or "503" in text:
+        return 503
+    if "INTERNAL" in text or "500" in text:
+        return 500
+    return None
+
+def is_retryable(e: Exception) -> bool:
+    if isinstance(e, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    return error_code(e) in RETRYABLE_CODES
+
+def retry_delay_hint(e: Exception):
+    """Server-suggested wait from a 429 body ("retryDelay": "17s"), if any."""
+    match = re.search(r"retryDelay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s", str(e))
+    return float(match.group(1)) if match else None
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+class LLMClient:
+    """
+    Quota-aware wrapper around client.aio.models.generate_content.
+    Every request takes a request-per-minute token and its estimated prompt tokens
+    from the shared buckets (corrected with the real usage afterwards), holds one of
+    `max_concurrency` slots, and is retried with full-jitter exponential backoff on
+    429/5xx/timeouts. With hedging on, a call that outlives the model's recent p95
+    latency gets one duplicate, sent only if budget and a slot are free right now;
+    the first response wins.
+    """
+
+    def __init__(self, get_client, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 max_retries: int = LLM_MAX_RETRIES, retry_base: float = LLM_RETRY_BASE,
+                 retry_max: float = LLM_RETRY_MAX, timeout: float = LLM_REQUEST_TIMEOUT,
+                 hedge: bool = LLM_HEDGE, hedge_min_samples: int = LLM_HEDGE_MIN_SAMPLES):
+        self.get_client = get_client
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.timeout = timeout
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.slots = asyncio.Semaphore(max(1, max_concurrency))
+        self.latencies = {}
+        self.stats = {"requests": 0, "retries": 0, "hedges": 0, "hedge_wins": 0}
+
+    def hedge_after(self, model: str):
+        """Seconds after which a call to this model is hedged, or None (off / too few samples)."""
+        samples = self.latencies.get(model)
+        if not self.hedge or not samples or len(samples) < self.hedge_min_samples:
+            return None
+        return percentile(samples, 95)
+
+    def _record_latency(self, model: str, seconds: float):
+        self.latencies.setdefault(model, deque(maxlen=200)).append(seconds)
+
+    async def _send(self, model: str, contents: str, config: dict, tokens: int, slot_held: bool = False):
+        """One request under the concurrency cap; reconciles the token estimate with real usage."""
+        loop = asyncio.get_running_loop()
+        if not slot_held:
+            await self.slots.acquire()
+        try:
+            started = loop.time()
+            self.stats["requests"] += 1
+            resp = await asyncio.wait_for(
+                self.get_client().aio.models.generate_content(model=model, contents=contents, config=config),
+                timeout=self.timeout,
+            )
+            self._record_latency(model, loop.time() - started)
+        finally:
+            self.slots.release()
+        usage = getattr(resp, "usage_metadata", None)
+        actual = getattr(usage, "prompt_token_count", None)
+        token_bucket = get_token_limiter()
+        if token_bucket is not None and actual:
+            token_bucket.adjust(actual - tokens)
+        return resp
+
+    async def _try_hedge(self, model: str, contents: str, config: dict, tokens: int):
+        """Starts a duplicate request if it fits in the budget without waiting; else None."""
+        token_bucket = get_token_limiter()
+        if self.slots.locked():
+            return None
+        if not get_llm_limiter().try_acquire(1):
+            return None
+        if token_bucket is not None and not token_bucket.try_acquire(tokens):
+            # The request token is spent; not worth unwinding for a skipped hedge
+            return None
+        await self.slots.acquire()
+        self.stats["hedges"] += 1
+        return asyncio.create_task(self._send(model, contents, config, tokens, slot_held=True))
+
+    async def _attempt(self, model: str, contents: str, config: dict, tokens: int, info: dict):
+        primary = asyncio.create_task(self._send(model, contents, config, tokens))
+        tasks = [primary]
+        try:
+            delay = self.hedge_after(model)
+            if delay is None:
+                return await primary
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                return primary.result()
+            hedge = await self._try_hedge(model, contents, config, tokens)
+            if hedge is None:
+                return await primary
+            tasks.append(hedge)
+            info["hedged"] = True
+            pending = {primary, hedge}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # The loser of a hedge, or both calls when the caller itself is cancelled
+            # while waiting: neither may keep holding a slot and spending quota
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def generate_content(self, model: str, contents: str, config: dict = None, info: dict = None):
+        """
+        generate_content with budgets, retries and hedging. `info` (optional dict)
+        receives retries/hedged for the caller's metrics. Non-retryable errors
+        (e.g. 404) raise immediately; transient ones raise LLMUnavailableError
+        once retries are exhausted.
+        """
+        info = {} if info is None else info
+        info.update(retries=0, hedged=False)
+        tokens = estimate_tokens(contents)
+        for attempt in range(self.max_retries + 1):
+            await get_llm_limiter().acquire()
+            token_bucket = get_token_limiter()
+            if token_bucket is not None:
+                await token_bucket.acquire(tokens)
+            try:
+                return await self._attempt(model, contents, config, tokens, info)
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                if attempt == self.max_retries:
+                    raise LLMUnavailableError(f"{model}: {e}") from e
+                backoff = random.uniform(0, min(self.retry_max, self.retry_base * 2 ** attempt))
+                delay = max(backoff, retry_delay_hint(e) or 0)
+                info["retries"] += 1
+                self.stats["retries"] += 1
+                print(f"  ! {model} transient error ({error_code(e) or type(e).__name__}), "
+                      f"retry {attempt + 1}/{self.max_retries} in {delay:.1f}s", flush=True)
+                await asyncio.sleep(delay)
+
+_llm_client = None
+
+def get_llm_client() -> LLMClient:
+    """Shared client layer for all Gemini generate calls in this process."""
+    global _llm_client
+    if _llm_client is None:
+        from .analyzer import get_client
+        _llm_client = LLMClient(get_client)
+    return _llm_client
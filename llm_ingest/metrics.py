@@ -0,0 +1,249 @@
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from .config import METRICS_LOG_FILE, METRICS_LOG_ENABLED, METRICS_LOG_MAX_BYTES
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile of a sample; 0.0 when empty."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))], 3)
+
+# Prometheus-style metrics
+
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SIZE_BUCKETS = (1e3, 1e4, 1e5, 1e6, 4e6, 16e6)
+
+_registry = []
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _label_str(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _header(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [f"{self.name}_total{_label_str(self.labelnames, k)} {v}" for k, v in items]
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [f"{self.name}{_label_str(self.labelnames, k)} {v}" for k, v in items]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted((k, dict(v, counts=list(v["counts"]))) for k, v in self._values.items())
+        lines = self._header()
+        for key, state in items:
+            bounds = [f'le="{b}"' for b in self.buckets] + ['le="+Inf"']
+            for le, count in zip(bounds, state["counts"] + [state["count"]]):
+                lines.append(f"{self.name}_bucket{_label_str(self.labelnames, key, le)} {count}")
+            lines.append(f"{self.name}_sum{_label_str(self.labelnames, key)} {round(state['sum'], 6)}")
+            lines.append(f"{self.name}_count{_label_str(self.labelnames, key)} {state['count']}")
+        return lines
+
+def render_metrics() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in list(_registry):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+SPAN_SECONDS = Histogram("xray_span_seconds", "Duration of pipeline spans.", ("span", "status"))
+STAGE_WAIT_SECONDS = Histogram("xray_stage_wait_seconds", "Time spent waiting for a stage slot.", ("stage",))
+JOBS = Counter("xray_jobs", "Finished ingest jobs.", ("status",))
+QUEUE_DEPTH = Gauge("xray_queue_depth", "Files waiting for a worker.")
+STAGE_IN_FLIGHT = Gauge("xray_stage_in_flight", "Jobs currently inside each stage.", ("stage",))
+LLM_CALLS = Counter("xray_llm_calls", "Gemini calls.", ("model", "status"))
+LLM_RETRIES = Counter("xray_llm_retries", "Gemini calls that were a fallback attempt.", ("model",))
+LLM_BACKOFFS = Counter("xray_llm_backoff_retries", "Gemini requests retried after 429/5xx/timeouts.", ("model",))
+LLM_HEDGES = Counter("xray_llm_hedged_calls", "Gemini calls that sent a hedged duplicate.", ("model",))
+LLM_TOKENS = Counter("xray_llm_tokens", "Gemini tokens.", ("model", "kind"))
+LLM_LATENCY = Histogram("xray_llm_latency_seconds", "Gemini call latency.", ("model",))
+LLM_PROMPT_CHARS = Histogram("xray_llm_prompt_chars", "Prompt size in characters.", (), SIZE_BUCKETS)
+LLM_OUTPUT_CHARS = Histogram("xray_llm_output_chars", "Response size in characters.", (), SIZE_BUCKETS)
+
+# Tracing: one trace per job, nested spans per stage
+
+_trace = ContextVar("xray_trace", default=None)
+_span = ContextVar("xray_span", default=None)
+# Callbacks receiving (name, duration_s, status) for every finished span
+_span_listeners = []
+_log_lock = threading.Lock()
+_log_file = None
+
+def log_event(record: dict):
+    """Appends one JSON line to the metrics log (rotated at METRICS_LOG_MAX_BYTES)."""
+    global _log_file
+    if not METRICS_LOG_ENABLED:
+        return
+    trace = _trace.get()
+    if trace is not None:
+        record = {"trace_id": trace["trace_id"], "job": trace["job"], **record}
+    line = json.dumps({"ts": round(time.time(), 3), **record}, default=str) + "\n"
+    with _log_lock:
+        try:
+            if _log_file is None:
+                METRICS_LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
+                _log_file = open(METRICS_LOG_FILE, "a", encoding="utf-8")
+            _log_file.write(line)
+            _log_file.flush()
+            if _log_file.tell() > METRICS_LOG_MAX_BYTES:
+                _log_file.close()
+                _log_file = None
+                METRICS_LOG_FILE.replace(METRICS_LOG_FILE.with_suffix(".jsonl.1"))
+        except OSError as e:
+            print(f"  ! Metrics log write failed: {e}", flush=True)
+
+def add_span_listener(fn):
+    _span_listeners.append(fn)
+
+def remove_span_listener(fn):
+    if fn in _span_listeners:
+        _span_listeners.remove(fn)
+
+@contextmanager
+def trace(job: str):
+    """Starts a trace for one job; spans opened inside (any task/thread copy of the context) join it."""
+    token = _trace.set({"trace_id": uuid.uuid4().hex[:16], "job": job})
+    try:
+        yield
+    finally:
+        _trace.reset(token)
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Times a block and records it as a span: a histogram sample plus a JSON line.
+    Yields a dict that the block can add attributes to (sizes, counts, model...).
+    """
+    parent = _span.get()
+    span_id = uuid.uuid4().hex[:8]
+    token = _span.set(span_id)
+    started = time.monotonic()
+    status = "ok"
+    try:
+        yield attrs
+    except BaseException as e:
+        status = "error"
+        attrs["error"] = str(e) or type(e).__name__
+        raise
+    finally:
+        _span.reset(token)
+        duration = time.monotonic() - started
+        SPAN_SECONDS.observe(duration, span=name, status=status)
+        for fn in list(_span_listeners):
+            fn(name, duration, status)
+        log_event({
+            "type": "span", "span": name, "span_id": span_id, "parent_id": parent,
+            "status": status, "duration_s": round(duration, 4), **attrs,
+        })
+
+def record_llm_call(record: dict):
+    """Analyzer call listener: LLM counters, latency and size histograms."""
+    model = record.get("model", "")
+    LLM_CALLS.inc(model=model, status="ok" if record.get("ok") else "error")
+    if record.get("attempt", 1) > 1:
+        LLM_RETRIES.inc(model=model)
+    if record.get("retries"):
+        LLM_BACKOFFS.inc(record["retries"], model=model)
+    if record.get("hedged"):
+        LLM_HEDGES.inc(model=model)
+    LLM_TOKENS.inc(record.get("prompt_tokens", 0), model=model, kind="prompt")
+    LLM_TOKENS.inc(record.get("output_tokens", 0), model=model, kind="output")
+    LLM_LATENCY.observe(record.get("latency_s", 0.0), model=model)
+    LLM_PROMPT_CHARS.observe(record.get("prompt_chars", 0))
+    if record.get("ok"):
+        LLM_OUTPUT_CHARS.observe(record.get("output_chars", 0))
+    log_event({"type": "llm_call", **record})
+
+# /metrics endpoint
+
+def start_metrics_server(host: str, port: int):
+    """Serves /metrics from a daemon thread. Returns the server, or None if the port is taken."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_metrics().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            # Scrapes every few seconds would drown the console
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        print(f"  ! Metrics endpoint disabled ({host}:{port}): {e}", flush=True)
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -2,49 +2,175 @@ import json
 import hashlib
 import asyncio
 import os
+import itertools
+from contextlib import asynccontextmanager
 from pathlib import Path
 from urllib.parse import urlparse
-from playwright.async_api import async_playwright
-from .config import STAGING_DIR, PROCESSED_IDS_FILE
+from .config import STAGING_DIR, INCREMENTAL_REINGEST
+from .processed_store import get_processed_store
+from . import incremental
+from .images import ImageCapture
+from . import metrics
 
-IMAGE_CT_PREFIX = "image/"
-
-def _safe_ext(content_type: str) -> str:
-    ct = (content_type or "").split(";")[0].strip().lower()
-    return {
-        "image/jpeg": ".jpg",
-        "image/png": ".png",
-        "image/webp": ".webp",
-        "image/gif": ".gif",
-        "image/svg+xml": ".svg",
-    }.get(ct, "")
+# Read size for streaming JSON exports
+STREAM_CHUNK_SIZE = 1 << 20
 
 def get_url_hash(url: str) -> str:
     return hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
 
-def is_already_processed(url: str) -> bool:
-    if not PROCESSED_IDS_FILE.exists():
-        return False
+def release_url_claim(file_path: Path):
+    """Releases a scrape claim left by a job that died mid-scrape."""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read(4096).strip()
+    except (OSError, UnicodeDecodeError):
+        return
+    if is_share_link(content):
+        get_processed_store().release(get_url_hash(content))
+
+# Adaptive scroll tuning
+SCROLL_MAX_STEPS = 150
+SCROLL_BASE_STEP = 3000      # px per wheel step while content is still loading
+SCROLL_MAX_STEP = 24000      # step grows toward this when nothing new appears
+SCROLL_QUIET_MS = 350        # DOM counts as settled after this long without mutations
+SCROLL_MAX_WAIT_MS = 4000    # upper bound on waiting for lazy-load per step
+SCROLL_STABLE_ROUNDS = 2     # stop after this many steps without new messages/height
+
+# Message nodes across ChatGPT / Gemini / generic share pages
+MESSAGE_COUNT_JS = """
+(sel) => {
+  const root = (sel && document.querySelector(sel)) || document.body;
+  const n = root.querySelectorAll(
+    '[data-message-author-role], user-query, model-response, .message, [data-testid^="conversation-turn"]'
+  ).length;
+  return n || root.childElementCount;
+}
+"""
+
+# Resolves once the container has had no mutations for quietMs (or maxMs elapses).
+# Returns true if anything changed, so callers can tell "settled" from "idle".
+WAIT_FOR_DOM_SETTLE_JS = """
+([sel, quietMs, maxMs]) => new Promise((resolve) => {
+  const root = (sel && document.querySelector(sel)) || document.body;
+  let mutated = false;
+  let quietTimer = null;
+  let maxTimer = null;
+  const obs = new MutationObserver(() => {
+    mutated = true;
+    clearTimeout(quietTimer);
+    quietTimer = setTimeout(finish, quietMs);
+  });
+  function finish() {
+    obs.disconnect();
+    clearTimeout(quietTimer);
+    clearTimeout(maxTimer);
+    resolve(mutated);
+  }
+  obs.observe(root, { childList: true, subtree: true, characterData: true });
+  quietTimer = setTimeout(finish, quietMs);
+  maxTimer = setTimeout(finish, maxMs);
+})
+"""
+
+async def _wait_for_network_idle(pending: set, timeout: float):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while pending and loop.time() < deadline:
+        await asyncio.sleep(0.05)
+
+async def adaptive_scroll(page, container_selector: str = None) -> dict:
+    """
+    Scrolls until the conversation stops growing.
+    Each step waits only as long as the DOM keeps mutating or requests are in flight,
+    the step size grows while nothing new loads, and we stop once both the message
+    count and page height are stable. Returns timing stats for the scroll.
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+
+    pending = set()
+    on_request = lambda req: pending.add(req)
+    on_done = lambda req: pending.discard(req)
+    page.on("request", on_request)
+    page.on("requestfinished", on_done)
+    page.on("requestfailed", on_done)
+
+    stats = {
+        "container": container_selector,
+        "steps": 0,
+        "messages": 0,
+        "final_height": 0,
+        "settle_wait_s": 0.0,
+        "stop_reason": "max_steps",
+    }
     try:
-        with open(PROCESSED_IDS_FILE, 'r') as f:
-            data = json.load(f)
-            return get_url_hash(url) in data
-    except:
-        return False
-
-def mark_as_processed(url: str):
-    data = {}
-    if PROCESSED_IDS_FILE.exists():
+        step = SCROLL_BASE_STEP
+        stable_rounds = 0
+        last_height = await page.evaluate("document.body.scrollHeight")
+        last_messages = await page.evaluate(MESSAGE_COUNT_JS, container_selector)
+
+        for i in range(SCROLL_MAX_STEPS):
+            await page.mouse.wheel(0, step)
+
+            wait_started = loop.time()
+            await page.evaluate(WAIT_FOR_DOM_SETTLE_JS, [container_selector, SCROLL_QUIET_MS, SCROLL_MAX_WAIT_MS])
+            remaining = SCROLL_MAX_WAIT_MS / 1000 - (loop.time() - wait_started)
+            if remaining > 0:
+                await _wait_for_network_idle(pending, remaining)
+            stats["settle_wait_s"] += loop.time() - wait_started
+            stats["steps"] = i + 1
+
+            new_height = await page.evaluate("document.body.scrollHeight")
+            messages = await page.evaluate(MESSAGE_COUNT_JS, container_selector)
+
+            if new_height == last_height and messages == last_messages:
+                stable_rounds += 1
+                if stable_rounds >= SCROLL_STABLE_ROUNDS:
+                    stats["stop_reason"] = "stable"
+                    break
+                # Nothing new: jump further to reach the bottom sooner
+                step = min(step * 2, SCROLL_MAX_STEP)
+            else:
+                stable_rounds = 0
+                # New content: drop back so lazy-loaded blocks are not skipped
+                step = SCROLL_BASE_STEP
+                if i % 5 == 0:
+                    print(f"      > Scrolled {i} times, height: {new_height}, messages: {messages}...")
+
+            last_height = new_height
+            last_messages = messages
+    finally:
+        page.remove_listener("request", on_request)
+        page.remove_listener("requestfinished", on_done)
+        page.remove_listener("requestfailed", on_done)
+
+    stats["messages"] = last_messages
+    stats["final_height"] = last_height
+    stats["settle_wait_s"] = round(stats["settle_wait_s"], 3)
+    stats["duration_s"] = round(loop.time() - started, 3)
+    return stats
+
+@asynccontextmanager
+async def _browser_context(browser_pool=None):
+    """
+    Leases a context from the shared pool, or launches a one-off browser
+    when no pool is running (e.g. ad-hoc calls outside the watcher).
+    """
+    if browser_pool is not None:
+        async with browser_pool.lease() as ctx:
+            yield ctx
+        return
+
+    # Imported here: Playwright is slow to import and only share links need it
+    from playwright.async_api import async_playwright
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
         try:
-            with open(PROCESSED_IDS_FILE, 'r') as f:
-                data = json.load(f)
-        except:
-            pass
-    data[get_url_hash(url)] = True
-    with open(PROCESSED_IDS_FILE, 'w') as f:
-        json.dump(data, f)
-
-async def scrape_text_and_images(url: str):
+            yield await browser.new_context()
+        finally:
+            await browser.close()
+
+async def scrape_text_and_images(url: str, browser_pool=None):
     """
     Scrapes text and images into a staged folder.
     Returns the path to the staging directory.
@@ -55,40 +181,18 @@ async def scrape_text_and_images(url: str):
     img_dir = out_dir / "images"
     img_dir.mkdir(parents=True, exist_ok=True)
 
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        ctx = await browser.new_context()
+    async with _browser_context(browser_pool) as ctx:
         page = await ctx.new_page()
 
-        async def on_response(resp):
-            try:
-                ct = (resp.headers.get("content-type") or "").lower()
-                if not ct.startswith(IMAGE_CT_PREFIX):
-                    return
-                # Filter small icons/pixels
-                if "pixel" in resp.url or "icon" in resp.url:
-                    return
-                
-                body = await resp.body()
-                if not body or len(body) < 1000: # Skip tiny images
-                    return
-
-                h = hashlib.sha256(resp.url.encode("utf-8")).hexdigest()[:12]
-                ext = _safe_ext(ct) or ".img"
-                path = img_dir / f"{h}{ext}"
-
-                if not path.exists():
-                    with open(path, "wb") as f:
-                        f.write(body)
-            except:
-                pass
-
-        page.on("response", on_response)
+        images = ImageCapture(img_dir)
+        page.on("response", images.on_response)
         
+        container_selector = None
         print(f"    - Navigating to {url}...")
         try:
             # Use 'commit' or 'domcontentloaded' instead of 'networkidle' to avoid timeouts on heavy pages
-            await page.goto(url, wait_until="domcontentloaded", timeout=45000)
+            with metrics.span("navigate"):
+                await page.goto(url, wait_until="domcontentloaded", timeout=45000)
             
             # Wait for any of the common message containers
             selectors = [
@@ -97,105 +201,231 @@ async def scrape_text_and_images(url: str):
               ".chat-content",           # Generic
               "article"                  # Generic
             ]
-            found = False
-            for selector in selectors:
-                try:
-                    await page.wait_for_selector(selector, timeout=5000)
-                    found = True
-                    break
-                except:
-                    continue
+            with metrics.span("selector_wait") as sp:
+                for selector in selectors:
+                    try:
+                        await page.wait_for_selector(selector, timeout=5000)
+                        container_selector = selector
+                        break
+                    except:
+                        continue
+                sp["selector"] = container_selector
             
-            if not found:
+            if not container_selector:
                 print("    ! Warning: Primary content container not found, proceeding with body.")
 
         except Exception as e:
             print(f"    ! Initial load failed: {e}. Trying to proceed anyway...")
 
-        # Incremental Smart Scroll (Dynamic/Infinite)
-        print("    - Performing dynamic scroll to capture massive conversation history...")
-        
-        # We use a larger max steps and check for stability
-        max_scroll_steps = 150 
-        stable_count = 0
-        last_height = await page.evaluate("document.body.scrollHeight")
-        
-        for i in range(max_scroll_steps):
-            # Scroll down
-            await page.mouse.wheel(0, 3000)
-            await asyncio.sleep(1.0) # Wait for page to react/lazy-load
-            
-            new_height = await page.evaluate("document.body.scrollHeight")
-            
-            # If height didn't change, we might be at the bottom or waiting for lazy load
-            if new_height == last_height:
-                stable_count += 1
-                if stable_count >= 3: # Allow 3 attempts to be sure
-                    break
-            else:
-                stable_count = 0 # Reset if we found new content
-                if i % 5 == 0:
-                    print(f"      > Scrolled {i} times, height: {new_height}...")
-            
-            last_height = new_height
-
-        print(f"    - Scroll complete. Final height: {last_height}")
+        # Event-driven scroll: react to DOM mutations/network instead of fixed sleeps
+        print("    - Performing adaptive scroll to capture massive conversation history...")
+        with metrics.span("scroll") as sp:
+            scroll_stats = await adaptive_scroll(page, container_selector)
+            sp.update(steps=scroll_stats["steps"], messages=scroll_stats["messages"], stop=scroll_stats["stop_reason"])
+        print(
+            f"    - Scroll complete in {scroll_stats['duration_s']}s "
+            f"({scroll_stats['steps']} steps, {scroll_stats['messages']} messages, "
+            f"height {scroll_stats['final_height']}, stop: {scroll_stats['stop_reason']})"
+        )
+        with open(out_dir / "scroll_stats.json", "w", encoding="utf-8") as f:
+            json.dump(scroll_stats, f, indent=2)
 
-        title = await page.title()
-        text = await page.evaluate("() => document.body?.innerText || ''")
+        with metrics.span("extract_text") as sp:
+            title = await page.title()
+            text = await page.evaluate("() => document.body?.innerText || ''")
+            sp["chars"] = len(text)
         
         # Save staging files
         with open(out_dir / "page.txt", "w", encoding="utf-8") as f:
             f.write(f"TITLE: {title}\nURL: {url}\n\n{text}")
 
-        await browser.close()
+        with metrics.span("image_drain") as sp:
+            await images.drain()
+            image_stats = images.summary()
+            sp.update(saved=image_stats["saved"], bytes=image_stats["bytes_saved"])
+        print(
+            f"    - Images: {image_stats['saved']} saved ({image_stats['bytes_saved'] // 1024} KB), "
+            f"{image_stats['duplicate']} duplicate, {image_stats['tracking']} tracking, "
+            f"{image_stats['over_budget'] + image_stats['too_large']} over budget"
+        )
+        with open(out_dir / "image_stats.json", "w", encoding="utf-8") as f:
+            json.dump(image_stats, f, indent=2)
 
     return out_dir
 
-async def parse_file_async(file_path: Path):
+async def parse_file_async(file_path: Path, browser_pool=None):
     """
     Async version of parser. Returns (content_string, optional_staging_dir).
+    Pass the watcher's BrowserPool to reuse a warm Chromium for share links.
     """
-    if file_path.suffix == '.json':
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        if isinstance(data, list) and len(data) > 0 and 'mapping' in data[0]:
-            return extract_chatgpt_json(data), None
-        return json.dumps(data, indent=2), None
+    if source_suffix(file_path) == '.json':
+        # Exports can be hundreds of MB; parse off the event loop
+        with metrics.span("parse_json") as sp:
+            content = await asyncio.to_thread(_parse_json_file, file_path)
+            sp["chars"] = len(content)
+        return content, None
 
     with open(file_path, 'r', encoding='utf-8') as f:
         content = f.read().strip()
     
-    if content.startswith('https://') and '\n' not in content and ' ' not in content:
-        if is_already_processed(content):
-            print(f"  ! URL already processed: {content}")
-            return None, None
-        
-        staging_dir = await scrape_text_and_images(content)
-        mark_as_processed(content)
-        
-        # Read the scraped text back for the analyzer
-        with open(staging_dir / "page.txt", "r", encoding="utf-8") as f:
-            return f.read(), staging_dir
+    if is_share_link(content):
+        return await parse_url_async(content, browser_pool=browser_pool)
             
     return content, None
 
-def extract_chatgpt_json(data) -> str:
-    text = ""
+def is_share_link(content: str) -> bool:
+    return content.startswith('https://') and '\n' not in content and ' ' not in content
+
+async def parse_url_async(url: str, browser_pool=None, refresh: bool = INCREMENTAL_REINGEST):
+    """
+    Scrapes a share link unless it was already processed.
+    Returns (page_text, staging_dir), or (None, None) for duplicates.
+    With `refresh`, a link that already has a note is scraped again and only the
+    appended messages are returned (incremental.load_update(staging_dir) then
+    describes the note to update); (None, None) if nothing was added.
+    The URL stays claimed until incremental.commit() marks it done after the
+    note is written; callers that fail later call incremental.release() so it is retried.
+    """
+    # Atomic check-and-claim: concurrent jobs for the same URL can't both scrape it
+    store = get_processed_store()
+    url_hash = get_url_hash(url)
+    refresh = refresh and url_hash in store and incremental.can_update(url_hash, STAGING_DIR / url_hash)
+    if not store.claim(url_hash, refresh=refresh):
+        print(f"  ! URL already processed: {url}")
+        return None, None
+
+    try:
+        with metrics.span("scrape"):
+            staging_dir = await scrape_text_and_images(url, browser_pool=browser_pool)
+    except BaseException:
+        store.release(url_hash)
+        raise
+
+    if refresh:
+        delta = await asyncio.to_thread(incremental.prepare_update, url_hash, staging_dir)
+        if delta is None:
+            print(f"  ! No new messages since the last ingest: {url}")
+            store.release(url_hash)
+            return None, None
+        return delta, staging_dir
+    (staging_dir / incremental.UPDATE_FILE).unlink(missing_ok=True)
+
+    # Read the scraped text back for the analyzer
+    with open(staging_dir / "page.txt", "r", encoding="utf-8") as f:
+        return f.read(), staging_dir
+
+def source_suffix(file_path: Path) -> str:
+    """Suffix of the original file, ignoring the watcher's .processing lock suffix."""
+    if file_path.suffix == '.processing':
+        return Path(file_path.stem).suffix
+    return file_path.suffix
+
+def _parse_json_file(file_path: Path) -> str:
+    conversations = iter_chatgpt_export(file_path)
+    first = next(conversations, None)
+    if first is not None:
+        return "".join(iter_chatgpt_chunks(itertools.chain([first], conversations)))
+    # Not a ChatGPT export: fall back to pretty-printing the whole document
+    with open(file_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return json.dumps(data, indent=2)
+
+def iter_json_array(file_path: Path, chunk_size: int = STREAM_CHUNK_SIZE):
+    """
+    Yields the elements of a top-level JSON array one at a time.
+    Only the current element plus at most one read of its size is held in memory.
+    Yields nothing if the document is not an array.
+    """
+    decoder = json.JSONDecoder()
+    with open(file_path, 'r', encoding='utf-8') as f:
+        buf = f.read(chunk_size)
+        pos = _skip_ws(buf, 0)
+        if pos >= len(buf) or buf[pos] != '[':
+            return
+        pos += 1
+        eof = False
+        # Bytes to append on the next failed decode; doubles while one element keeps
+        # outgrowing the buffer, so re-decoding a huge element stays linear overall
+        read_size = chunk_size
+        while True:
+            pos = _skip_ws(buf, pos)
+            if pos < len(buf) and buf[pos] == ',':
+                pos = _skip_ws(buf, pos + 1)
+            if pos < len(buf) and buf[pos] == ']':
+                return
+            try:
+                if pos >= len(buf):
+                    raise json.JSONDecodeError("buffer exhausted", buf, pos)
+                obj, end = decoder.raw_decode(buf, pos)
+                after = _skip_ws(buf, end)
+                if not eof and (after >= len(buf) or buf[after] not in ',]'):
+                    # Not followed by a separator yet: a number cut at the buffer edge
+                    # still decodes ("12" of "12345", "3" of "3.5")
+                    raise json.JSONDecodeError("value may continue past the buffer", buf, end)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # Element spans the buffer edge: drop consumed text and read more
+                more = f.read(read_size)
+                read_size *= 2
+                eof = not more
+                buf = buf[pos:] + more
+                pos = 0
+                continue
+            yield obj
+            read_size = chunk_size
+            pos = end
+            if pos > chunk_size:
+                buf = buf[pos:]
+                pos = 0
+
+def _skip_ws(buf: str, pos: int) -> int:
+    while pos < len(buf) and buf[pos] in ' \t\r\n':
+        pos += 1
+    return pos
+
+def iter_chatgpt_export(file_path: Path):
+    """Streams conversations from a ChatGPT conversations.json export."""
+    for i, conv in enumerate(iter_json_array(file_path)):
+        if i == 0 and not (isinstance(conv, dict) and 'mapping' in conv):
+            return
+        yield conv
+
+def iter_conversation_messages(conv: dict):
+    """
+    Walks the mapping parent/children tree depth-first from its root(s),
+    yielding (role, text) in conversation order. Linear in the node count.
+    """
+    mapping = conv.get('mapping') or {}
+    roots = [k for k, v in mapping.items() if not v.get('parent') or v.get('parent') not in mapping]
+    stack = list(reversed(roots))
+    seen = set()
+    while stack:
+        key = stack.pop()
+        if key in seen:
+            continue
+        seen.add(key)
+        node = mapping.get(key) or {}
+        msg = node.get('message')
+        if msg and msg.get('content') and msg.get('create_time'):
+            role = (msg.get('author') or {}).get('role', 'unknown')
+            content_parts = msg['content'].get('parts') or []
+            c_text = "".join([str(p) for p in content_parts if isinstance(p, str)])
+            if c_text.strip():
+                yield role, c_text
+        stack.extend(reversed([c for c in node.get('children') or [] if c in mapping]))
+
+def extract_conversation_text(conv: dict) -> str:
+    title = conv.get('title', 'Unknown Title')
+    parts = [f"\n\n# Conversation: {title}\n\n"]
+    for role, c_text in iter_conversation_messages(conv):
+        parts.append(f"**{role.upper()}**: {c_text}\n\n")
+    return "".join(parts)
+
+def iter_chatgpt_chunks(data):
+    """Yields one text chunk per conversation."""
     for conv in data:
-        title = conv.get('title', 'Unknown Title')
-        text += f"\n\n# Conversation: {title}\n\n"
-        mapping = conv.get('mapping', {})
-        messages = []
-        for key, value in mapping.items():
-            msg = value.get('message')
-            if msg and msg.get('content') and msg.get('create_time'):
-                role = msg.get('author', {}).get('role', 'unknown')
-                content_parts = msg['content'].get('parts', [])
-                c_text = "".join([str(p) for p in content_parts if isinstance(p, str)])
-                if c_text.strip():
-                    messages.append({'time': msg['create_time'], 'role': role, 'text': c_text})
-        messages.sort(key=lambda x: x['time'])
-        for m in messages:
-            text += f"**{m['role'].upper()}**: {m['text']}\n\n"
-    return text
+        yield extract_conversation_text(conv)
+
+def extract_chatgpt_json(data) -> str:
+    return "".join(iter_chatgpt_chunks(data))
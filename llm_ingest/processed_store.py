@@ -0,0 +1,148 @@
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from .config import PROCESSED_DB_FILE, PROCESSED_IDS_FILE
+
+# A claim older than this is assumed to belong to a crashed job
+CLAIM_TTL_SECONDS = 3600
+
+class ProcessedStore:
+    """
+    Dedup store for scraped URLs, keyed by URL hash.
+    SQLite (WAL) is the durable log; a hash set loaded once at startup answers
+    lookups in O(1). claim() is an atomic check-and-claim, so two concurrent
+    jobs (or processes) can never both scrape the same URL. Each done URL also
+    remembers the note it produced, so a grown conversation can update it in place.
+    """
+
+    def __init__(self, db_path: Path = PROCESSED_DB_FILE, legacy_json: Path = PROCESSED_IDS_FILE):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS processed ("
+            " url_hash TEXT PRIMARY KEY,"
+            " status TEXT NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " note_path TEXT)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(processed)")}
+        if "note_path" not in columns:
+            self._conn.execute("ALTER TABLE processed ADD COLUMN note_path TEXT")
+        self._import_legacy(legacy_json)
+        self._done = {row[0] for row in self._conn.execute("SELECT url_hash FROM processed WHERE status = 'done'")}
+
+    def _import_legacy(self, legacy_json: Path):
+        """One-time migration from the old processed_ids.json dict."""
+        if not legacy_json or not Path(legacy_json).exists():
+            return
+        if self._conn.execute("SELECT 1 FROM processed LIMIT 1").fetchone():
+            return
+        try:
+            with open(legacy_json, 'r') as f:
+                data = json.load(f)
+        except Exception:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO processed (url_hash, status, updated_at) VALUES (?, 'done', ?)",
+                [(h, now) for h in data],
+            )
+            self._conn.execute("COMMIT")
+        print(f"  > Imported {len(data)} processed ids from {Path(legacy_json).name}", flush=True)
+
+    def __contains__(self, url_hash: str) -> bool:
+        return url_hash in self._done
+
+    def __len__(self) -> int:
+        return len(self._done)
+
+    def claim(self, url_hash: str, refresh: bool = False) -> bool:
+        """
+        Atomically claims a hash for scraping.
+        Returns False if it is already done or claimed by a live job.
+        With refresh=True a done hash can be claimed again (status 'refreshing')
+        to re-scrape a conversation that has grown.
+        """
+        if url_hash in self._done and not refresh:
+            return False
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                cur = self._conn.execute(
+                    "INSERT INTO processed (url_hash, status, updated_at) VALUES (?, 'claimed', ?) "
+                    "ON CONFLICT(url_hash) DO UPDATE SET updated_at = excluded.updated_at, "
+                    " status = CASE WHEN processed.status = 'claimed' THEN 'claimed' ELSE 'refreshing' END "
+                    "WHERE (processed.status != 'done' AND processed.updated_at < ?) "
+                    " OR (? AND processed.status = 'done')",
+                    (url_hash, now, now - CLAIM_TTL_SECONDS, refresh),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return cur.rowcount == 1
+
+    def mark_done(self, url_hash: str, note_path: Path = None):
+        """Marks a URL done once its note is written, remembering the note for later updates."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO processed (url_hash, status, updated_at, note_path) VALUES (?, 'done', ?, ?) "
+                "ON CONFLICT(url_hash) DO UPDATE SET status = 'done', updated_at = excluded.updated_at, "
+                " note_path = COALESCE(excluded.note_path, processed.note_path)",
+                (url_hash, time.time(), str(note_path) if note_path else None),
+            )
+            self._done.add(url_hash)
+
+    def release(self, url_hash: str):
+        """Drops a claim after a failed scrape so the URL can be retried (a refresh reverts to done)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM processed WHERE url_hash = ? AND status = 'claimed'", (url_hash,))
+            self._conn.execute(
+                "UPDATE processed SET status = 'done' WHERE url_hash = ? AND status = 'refreshing'", (url_hash,)
+            )
+
+    def get_note_path(self, url_hash: str):
+        """The vault note a done URL was written to, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT note_path FROM processed WHERE url_hash = ?", (url_hash,)).fetchone()
+        return Path(row[0]) if row and row[0] else None
+
+    def compact(self):
+        """Clears stale claims, checkpoints the WAL and vacuums the database."""
+        with self._lock:
+            cur = self._conn.execute(
+                "DELETE FROM processed WHERE status = 'claimed' AND updated_at < ?",
+                (time.time() - CLAIM_TTL_SECONDS,),
+            )
+            self._conn.execute(
+                "UPDATE processed SET status = 'done' WHERE status = 'refreshing' AND updated_at < ?",
+                (time.time() - CLAIM_TTL_SECONDS,),
+            )
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conn.execute("VACUUM")
+            self._done = {row[0] for row in self._conn.execute("SELECT url_hash FROM processed WHERE status = 'done'")}
+        return cur.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_processed_store() -> ProcessedStore:
+    """Process-wide store, opened on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ProcessedStore()
+        return _store
@@ -0,0 +1,72 @@
+import asyncio
+import time
+from .config import LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE
+
+class TokenBucket:
+    """
+    Async token bucket. `rate` tokens refill per second up to `capacity`;
+    acquire(n) waits until n tokens are available.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, n: float = 1):
+        # Oversized requests are clamped so they can't wait forever
+        n = min(n, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= n:
+                    self._tokens -= n
+                    return
+                await asyncio.sleep((n - self._tokens) / self.rate)
+
+    def try_acquire(self, n: float = 1) -> bool:
+        """Takes n tokens only if they are available right now (never waits)."""
+        n = min(n, self.capacity)
+        if self._lock.locked():
+            return False
+        self._refill()
+        if self._tokens >= n:
+            self._tokens -= n
+            return True
+        return False
+
+    def adjust(self, n: float):
+        """
+        Corrects an earlier estimate once the real cost is known: positive n takes
+        more tokens (the balance may go negative, delaying later callers), negative n refunds.
+        """
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens - n)
+
+def per_minute(limit: float) -> TokenBucket:
+    """Bucket allowing `limit` acquisitions per minute, bursting up to the full minute's worth."""
+    return TokenBucket(rate=limit / 60.0, capacity=max(1.0, limit))
+
+_llm_limiter = None
+_token_limiter = None
+
+def get_llm_limiter() -> TokenBucket:
+    """Shared request limiter for all Gemini calls in this process."""
+    global _llm_limiter
+    if _llm_limiter is None:
+        _llm_limiter = per_minute(LLM_REQUESTS_PER_MINUTE)
+    return _llm_limiter
+
+def get_token_limiter():
+    """Shared prompt-token budget (tokens per minute); None when LLM_TOKENS_PER_MINUTE is 0."""
+    global _token_limiter
+    if _token_limiter is None and LLM_TOKENS_PER_MINUTE > 0:
+        _token_limiter = per_minute(LLM_TOKENS_PER_MINUTE)
+    return _token_limiter
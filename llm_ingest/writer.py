@@ -1,56 +1,174 @@
+import os
 import re
+import sys
 import shutil
+import asyncio
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from .config import VAULT_DIR, ATTACHMENTS_DIR
+from .config import VAULT_DIR, ATTACHMENTS_DIR, ATTACHMENT_COPY_WORKERS
+from .index import get_vault_index
+from . import metrics
+
+# Attachments are stored once per content hash, shared across notes
+SHARED_ATTACHMENTS_DIR = ATTACHMENTS_DIR / 'by-hash'
+ATTACHMENT_LINK_PREFIX = 'Resources/AI_Attachments/by-hash'
+# Linux FICLONE ioctl (copy-on-write reflink on btrfs/xfs)
+FICLONE = 0x40049409
 
 def sanitize_filename(title: str) -> str:
     s = re.sub(r'[<>:"/\\|?*]', '', title)
     return s.strip()
 
-def get_unique_path(base_path: Path) -> Path:
-    if not base_path.exists():
-        return base_path
-    counter = 1
+def get_unique_path(base_path: Path, taken: set = frozenset()) -> Path:
+    """
+    First free name among 'Title.md', 'Title (1).md', ... Names in `taken`
+    (known from the vault index) are skipped without touching the filesystem;
+    only the chosen candidate is checked on disk.
+    """
+    counter = 0
     while True:
-        new_path = base_path.with_name(f"{base_path.stem} ({counter}){base_path.suffix}")
-        if not new_path.exists():
+        new_path = base_path if counter == 0 else base_path.with_name(f"{base_path.stem} ({counter}){base_path.suffix}")
+        if new_path.name not in taken and not new_path.exists():
             return new_path
         counter += 1
 
-def write_note_sync(analysis: dict, original_source: str, staging_dir: Path = None) -> Path:
+def _indexed_names(base_path: Path) -> set:
+    try:
+        return get_vault_index().taken_names(base_path)
+    except Exception as e:
+        print(f"  ! Vault index unavailable, probing names on disk: {e}", flush=True)
+        return set()
+
+def index_note(path: Path, content: str = None):
+    """Adds a written note to the vault index; a failure never fails the write."""
+    try:
+        get_vault_index().add(path, content)
+    except Exception as e:
+        print(f"  ! Could not index {path.name}: {e}", flush=True)
+
+def file_digest(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def _reflink(src: Path, dest: Path) -> bool:
+    if not sys.platform.startswith('linux'):
+        return False
+    import fcntl
+    try:
+        with open(src, 'rb') as s, open(dest, 'wb') as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        return True
+    except OSError:
+        dest.unlink(missing_ok=True)
+        return False
+
+def link_or_copy(src: Path, dest: Path):
     """
-    Formats the analysis and syncs images to the Vault.
-    Returns the final note path.
+    Places src at dest as cheaply as possible: hardlink when both share a
+    filesystem, then reflink, then a regular copy. The file appears at dest atomically.
     """
-    date_str = datetime.now().strftime('%Y-%m-%d')
+    if dest.exists():
+        return
+    tmp = dest.with_name(f".{dest.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        try:
+            os.link(src, dest)
+            return
+        except FileExistsError:
+            # Same content already placed by a concurrent writer
+            return
+        except OSError:
+            pass
+        if not _reflink(src, tmp):
+            shutil.copy2(src, tmp)
+        os.replace(tmp, dest)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+def store_attachment(img: Path) -> str:
+    """Stores an image once by content hash and returns its vault link path."""
+    digest = file_digest(img)
+    name = f"{digest}{img.suffix}"
+    link_or_copy(img, SHARED_ATTACHMENTS_DIR / name)
+    return f"{ATTACHMENT_LINK_PREFIX}/{name}"
+
+def sync_attachments(staging_dir: Path) -> list:
+    """Hashes and places all staged images in parallel. Returns link paths in stable order."""
+    staged_imgs = staging_dir / "images"
+    if not staged_imgs.exists():
+        return []
+    images = sorted(p for p in staged_imgs.iterdir() if p.is_file() and not p.name.startswith('.'))
+    if not images:
+        return []
+    SHARED_ATTACHMENTS_DIR.mkdir(parents=True, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=ATTACHMENT_COPY_WORKERS) as pool:
+        links = list(pool.map(store_attachment, images))
+    # Identical images under different names collapse to one link
+    return list(dict.fromkeys(links))
+
+def write_atomic_unique(target_path: Path, content: str) -> Path:
+    """
+    Writes to a temp file, then links it into place under the first free name.
+    Readers never see a partial note, and two writers can't claim the same name.
+    """
+    fd, tmp_name = tempfile.mkstemp(dir=target_path.parent, prefix=".", suffix=".tmp")
+    tmp = Path(tmp_name)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates 0600; notes should be readable like any other file
+        os.chmod(tmp, 0o644)
+        taken = set(_indexed_names(target_path))
+        while True:
+            candidate = get_unique_path(target_path, taken)
+            try:
+                os.link(tmp, candidate)
+                return candidate
+            except FileExistsError:
+                # Lost a race for this name; probe again
+                taken.add(candidate.name)
+                continue
+            except OSError:
+                # Filesystem without hardlinks: fall back to rename
+                os.replace(tmp, candidate)
+                return candidate
+    finally:
+        tmp.unlink(missing_ok=True)
+
+def write_atomic_replace(path: Path, content: str):
+    """Replaces an existing note in one rename, keeping readers off partial content."""
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=".", suffix=".tmp")
+    tmp = Path(tmp_name)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+def render_note(analysis: dict, original_source: str, attachment_paths: list, date_str: str) -> str:
     topic = analysis.get('topic', 'Untitled Insight')
-    safe_title = sanitize_filename(topic)
-    filename = f"{date_str} - {safe_title}.md"
-    
-    target_path = VAULT_DIR / filename
-    final_path = get_unique_path(target_path)
-    # Extract unique ID for attachments (use timestamp or path stem)
-    vault_id = f"{date_str}_{int(datetime.now().timestamp())}"
-    
     tags = analysis.get('tags', [])
     tags_str = ", ".join(tags)
-    
-    # Handle Attachments
+
     attachment_links = ""
-    if staging_dir:
-        staged_imgs = staging_dir / "images"
-        if staged_imgs.exists():
-            vault_img_dir = ATTACHMENTS_DIR / vault_id
-            images = list(staged_imgs.glob("*"))
-            if images:
-                vault_img_dir.mkdir(parents=True, exist_ok=True)
-                attachment_links = "\n## Attachments\n"
-                for img in images:
-                    dest = vault_img_dir / img.name
-                    shutil.copy2(img, dest)
-                    # Obsidian internal link
-                    attachment_links += f"![[Resources/AI_Attachments/{vault_id}/{img.name}]]\n"
+    if attachment_paths:
+        attachment_links = "\n## Attachments\n"
+        for link in attachment_paths:
+            # Obsidian internal link
+            attachment_links += f"![[{link}]]\n"
 
     # Handle optional code snippet
     code_block = ""
@@ -58,7 +176,7 @@ def write_note_sync(analysis: dict, original_source: str, staging_dir: Path = No
         code_block = f"\n## Artifacts\n```\n{analysis['code_snippet']}\n```\n"
 
     # Construct Content
-    content = f"""---
+    return f"""---
 date: {date_str}
 source: {original_source}
 tags: [{tags_str}]
@@ -76,7 +194,86 @@ status: unverified
 {analysis.get('blog_post', '')}
 """
 
-    with open(final_path, 'w', encoding='utf-8') as f:
-        f.write(content)
-        
-    return final_path
+def write_note_sync(analysis: dict, original_source: str, staging_dir: Path = None) -> Path:
+    """
+    Formats the analysis and syncs images to the Vault.
+    Returns the final note path.
+    """
+    date_str = datetime.now().strftime('%Y-%m-%d')
+    topic = analysis.get('topic', 'Untitled Insight')
+    safe_title = sanitize_filename(topic)
+    filename = f"{date_str} - {safe_title}.md"
+
+    # Handle Attachments
+    with metrics.span("attachments") as sp:
+        attachment_paths = sync_attachments(staging_dir) if staging_dir else []
+        sp["count"] = len(attachment_paths)
+
+    content = render_note(analysis, original_source, attachment_paths, date_str)
+    with metrics.span("write_note", chars=len(content)):
+        note_path = write_atomic_unique(VAULT_DIR / filename, content)
+    with metrics.span("index_note"):
+        index_note(note_path, content)
+    return note_path
+
+def render_update(analysis: dict, attachment_paths: list, date_str: str) -> str:
+    """An appended section for messages added to the conversation after the note was written."""
+    code_block = ""
+    if analysis.get('code_snippet'):
+        code_block = f"\n### Artifacts\n```\n{analysis['code_snippet']}\n```\n"
+    attachment_links = ""
+    if attachment_paths:
+        attachment_links = "\n### Attachments\n" + "".join(f"![[{link}]]\n" for link in attachment_paths)
+    return f"""
+## Update {date_str}: {analysis.get('topic', 'Continued')}
+
+### Context
+{analysis.get('problem_context', '')}
+
+### The Solution
+{analysis.get('solution_insight', '')}
+{code_block}{attachment_links}
+### Blog Post draft
+{analysis.get('blog_post', '')}
+"""
+
+def merge_frontmatter(note: str, tags: list, date_str: str) -> str:
+    """Adds new tags to the note's tag list and stamps `updated:`."""
+    match = re.search(r"^tags: \[(.*)\]$", note, re.MULTILINE)
+    if match:
+        existing = [t.strip() for t in match.group(1).split(",") if t.strip()]
+        merged = ", ".join(dict.fromkeys(existing + list(tags)))
+        note = note[:match.start()] + f"tags: [{merged}]" + note[match.end():]
+    if re.search(r"^updated: .*$", note, re.MULTILINE):
+        return re.sub(r"^updated: .*$", f"updated: {date_str}", note, count=1, flags=re.MULTILINE)
+    return re.sub(r"^(date: .*)$", rf"\1\nupdated: {date_str}", note, count=1, flags=re.MULTILINE)
+
+def update_note_sync(note_path: Path, analysis: dict, staging_dir: Path = None) -> Path:
+    """
+    Appends an incremental analysis to an existing note in place: merged tags,
+    an `updated:` stamp and a dated update section with any new attachments.
+    """
+    date_str = datetime.now().strftime('%Y-%m-%d')
+    note_path = Path(note_path)
+    note = note_path.read_text(encoding='utf-8')
+
+    with metrics.span("attachments") as sp:
+        links = sync_attachments(staging_dir) if staging_dir else []
+        # Images already shown earlier in the conversation are linked there
+        attachment_paths = [link for link in links if link not in note]
+        sp["count"] = len(attachment_paths)
+
+    content = merge_frontmatter(note, analysis.get('tags', []), date_str).rstrip("\n") + "\n"
+    content += render_update(analysis, attachment_paths, date_str)
+    with metrics.span("write_note", chars=len(content), update=True):
+        write_atomic_replace(note_path, content)
+    with metrics.span("index_note"):
+        index_note(note_path, content)
+    return note_path
+
+async def update_note_async(note_path: Path, analysis: dict, staging_dir: Path = None) -> Path:
+    return await asyncio.to_thread(update_note_sync, note_path, analysis, staging_dir)
+
+async def write_note_async(analysis: dict, original_source: str, staging_dir: Path = None) -> Path:
+    """write_note_sync on a worker thread, so image copies never block the event loop."""
+    return await asyncio.to_thread(write_note_sync, analysis, original_source, staging_dir)
@@ -2,107 +2,579 @@ import sys
 import time
 import shutil
 import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
 from pathlib import Path
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
-from llm_ingest.config import INGEST_DIR, ARCHIVE_DIR
-from llm_ingest import parser, analyzer, writer
+from llm_ingest.config import (
+    INGEST_DIR, ARCHIVE_DIR, ensure_dirs,
+    SCRAPE_CONCURRENCY, ANALYZE_CONCURRENCY, WRITE_CONCURRENCY,
+    INGEST_QUEUE_SIZE, METRICS_REPORT_INTERVAL, SPLIT_EXPORTS,
+    WRITE_STABLE_SECONDS, WRITE_POLL_INTERVAL, SMALL_FILE_BYTES,
+    METRICS_HOST, METRICS_PORT,
+)
+from llm_ingest import parser, analyzer, writer, batch, metrics, incremental
+from llm_ingest.browser_pool import BrowserPool
+from llm_ingest.journal import JobJournal, get_journal
+from llm_ingest.index import get_vault_index
+from llm_ingest.metrics import percentile
+
+class IngestScheduler:
+    """
+    Bounded worker pool for ingest jobs.
+    Files wait in a bounded queue (when it is full, ready files are held back in the
+    write-completion detector, which is our backpressure) and each pipeline stage has its own concurrency limit,
+    so a burst of drops drains at a steady rate instead of launching everything at once.
+    """
+
+    def __init__(self, loop, limits: dict, queue_size: int):
+        self.loop = loop
+        self.limits = dict(limits)
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.semaphores = {name: asyncio.Semaphore(n) for name, n in self.limits.items()}
+        self.in_flight = {name: 0 for name in self.limits}
+        self.waiting = {name: 0 for name in self.limits}
+        self.queued = set()
+        self.detected_at = {}
+        # Detection -> job finished, in seconds (most recent jobs)
+        self.latencies = deque(maxlen=1000)
+        self.completed = 0
+        self.failed = 0
+        self.started_at = time.monotonic()
+        self.workers = []
+        self.closed = False
+
+    def start(self, process):
+        """Spawns enough workers to saturate every stage at once."""
+        for i in range(sum(self.limits.values())):
+            self.workers.append(self.loop.create_task(self._worker(process), name=f"ingest-worker-{i}"))
+
+    async def submit(self, filepath: Path, detected_at: float = None):
+        """Queues a file; waits while the queue is full. `detected_at` is a monotonic timestamp."""
+        # Coalesce duplicate events for a file that is already waiting
+        if filepath in self.queued or self.closed:
+            return
+        self.queued.add(filepath)
+        self.detected_at[filepath] = detected_at or time.monotonic()
+        await self.queue.put(filepath)
+        metrics.QUEUE_DEPTH.set(self.queue.qsize())
+
+    async def _worker(self, process):
+        while True:
+            filepath = await self.queue.get()
+            metrics.QUEUE_DEPTH.set(self.queue.qsize())
+            self.queued.discard(filepath)
+            detected_at = self.detected_at.pop(filepath, None)
+            try:
+                ok = await process(filepath)
+                if ok is False:
+                    self.failed += 1
+                    metrics.JOBS.inc(status="failed")
+                else:
+                    self.completed += 1
+                    metrics.JOBS.inc(status="done")
+            except Exception as e:
+                self.failed += 1
+                metrics.JOBS.inc(status="failed")
+                print(f"  [ERROR] Worker failed on {filepath.name}: {e}", flush=True)
+            finally:
+                if detected_at is not None:
+                    self.latencies.append(time.monotonic() - detected_at)
+                self.queue.task_done()
+
+    @asynccontextmanager
+    async def stage(self, name: str):
+        """Holds one slot of the named stage's concurrency limit."""
+        self.waiting[name] += 1
+        wait_started = time.monotonic()
+        try:
+            await self.semaphores[name].acquire()
+        finally:
+            self.waiting[name] -= 1
+        metrics.STAGE_WAIT_SECONDS.observe(time.monotonic() - wait_started, stage=name)
+        self.in_flight[name] += 1
+        metrics.STAGE_IN_FLIGHT.set(self.in_flight[name], stage=name)
+        try:
+            yield
+        finally:
+            self.in_flight[name] -= 1
+            metrics.STAGE_IN_FLIGHT.set(self.in_flight[name], stage=name)
+            self.semaphores[name].release()
+
+    def is_busy(self) -> bool:
+        return self.queue.qsize() > 0 or any(self.in_flight.values()) or any(self.waiting.values())
+
+    def snapshot(self) -> dict:
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        return {
+            "queue_depth": self.queue.qsize(),
+            "in_flight": dict(self.in_flight),
+            "waiting": dict(self.waiting),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rate_per_min": round(self.completed / elapsed * 60, 2),
+            "latency_p50_s": percentile(self.latencies, 50),
+            "latency_p95_s": percentile(self.latencies, 95),
+        }
+
+    def report(self, detector=None):
+        m = self.snapshot()
+        stages = " ".join(
+            f"{name}={m['in_flight'][name]}/{self.limits[name]}(+{m['waiting'][name]})"
+            for name in self.limits
+        )
+        print(
+            f"[QUEUE] depth={m['queue_depth']} {stages} "
+            f"done={m['completed']} failed={m['failed']} rate={m['rate_per_min']}/min "
+            f"latency p50={m['latency_p50_s']}s p95={m['latency_p95_s']}s",
+            flush=True,
+        )
+        if detector is not None:
+            d = detector.snapshot()
+            print(
+                f"[WRITES] settling={d['pending']} settle p50={d['settle_p50_s']}s "
+                f"p95={d['settle_p95_s']}s max={d['settle_max_s']}s",
+                flush=True,
+            )
+
+    async def stop(self):
+        self.closed = True
+        # Drain the queue so a submit() waiting on a full queue can return
+        while not self.queue.empty():
+            self.queue.get_nowait()
+            self.queue.task_done()
+        for w in self.workers:
+            w.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+
+class WriteCompletionDetector:
+    """
+    Holds files until their writer is done, then hands them to the scheduler.
+    Events for one path coalesce into a single pending entry. A file is ready
+    as soon as it is closed after writing (inotify) or moved in whole; otherwise
+    once its size and mtime stop changing. Small files only need one quiet poll,
+    large ones must hold still for WRITE_STABLE_SECONDS.
+    """
+
+    def __init__(self, loop, scheduler: IngestScheduler):
+        self.loop = loop
+        self.scheduler = scheduler
+        self.pending = {}
+        self.settle_times = deque(maxlen=1000)
+        self._wake = asyncio.Event()
+
+    def touch_threadsafe(self, path: Path, complete: bool = False):
+        """Called from the watchdog thread for created/modified/closed/moved events."""
+        self.loop.call_soon_threadsafe(self.touch, path, complete)
+
+    def touch(self, path: Path, complete: bool = False):
+        now = time.monotonic()
+        entry = self.pending.get(path)
+        if entry is None:
+            entry = self.pending[path] = {"detected_at": now, "signature": None, "stable_since": now, "complete": False}
+        entry["complete"] = entry["complete"] or complete
+        if complete:
+            self._wake.set()
+
+    @staticmethod
+    def _signature(path: Path):
+        st = path.stat()
+        return st.st_size, st.st_mtime_ns
+
+    def _is_ready(self, path: Path, entry: dict, now: float) -> bool:
+        signature = self._signature(path)
+        changed = signature != entry["signature"]
+        first_look = entry["signature"] is None
+        entry["signature"] = signature
+        if changed:
+            entry["stable_since"] = now
+        if entry["complete"] and (first_look or not changed):
+            return True
+        # Copied in with an old mtime (e.g. mv/cp -p) and not touched since
+        if time.time() - signature[1] / 1e9 >= WRITE_STABLE_SECONDS and not first_look and not changed:
+            return True
+        if first_look or changed:
+            return False
+        required = WRITE_POLL_INTERVAL if signature[0] < SMALL_FILE_BYTES else WRITE_STABLE_SECONDS
+        return now - entry["stable_since"] >= required
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=WRITE_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            now = time.monotonic()
+            for path, entry in list(self.pending.items()):
+                try:
+                    ready = self._is_ready(path, entry, now)
+                except FileNotFoundError:
+                    # Deleted or renamed away before it settled
+                    del self.pending[path]
+                    continue
+                except Exception as e:
+                    # e.g. PermissionError while the writer still holds it: keep polling, log once
+                    if not entry.get("error"):
+                        entry["error"] = True
+                        print(f"  ! Cannot check {path.name} yet: {e}", flush=True)
+                    continue
+                if ready:
+                    del self.pending[path]
+                    self.settle_times.append(now - entry["detected_at"])
+                    try:
+                        await self.scheduler.submit(path, detected_at=entry["detected_at"])
+                    except Exception as e:
+                        # A re-drop or the startup scan picks it up again
+                        print(f"  [ERROR] Could not queue {path.name}: {e}", flush=True)
+
+    def snapshot(self) -> dict:
+        return {
+            "pending": len(self.pending),
+            "settle_p50_s": percentile(self.settle_times, 50),
+            "settle_p95_s": percentile(self.settle_times, 95),
+            "settle_max_s": round(max(self.settle_times), 3) if self.settle_times else 0.0,
+        }
 
 class IngestHandler(FileSystemEventHandler):
-    def __init__(self, loop):
+    def __init__(self, loop, scheduler: IngestScheduler, browser_pool: BrowserPool = None,
+                 journal: JobJournal = None, detector: WriteCompletionDetector = None):
         self.loop = loop
+        self.scheduler = scheduler
+        self.detector = detector or WriteCompletionDetector(loop, scheduler)
+        self.browser_pool = browser_pool
+        self.journal = journal or get_journal()
+        self.started_at = time.time()
+
+    @staticmethod
+    def _wanted(filepath: Path) -> bool:
+        # Filter: Only process if it's NOT a lock/error file and NOT hidden
+        return not (filepath.name.startswith('.') or filepath.suffix in ('.processing', '.error'))
 
     def on_created(self, event):
         if event.is_directory:
             return
         filepath = Path(event.src_path)
-        
-        # Filter: Only process if it's NOT a .processing file and NOT hidden
-        if filepath.name.startswith('.') or filepath.suffix == '.processing':
+        if not self._wanted(filepath):
             return
 
         print(f"\n[DETECTED] New file: {filepath.name}", flush=True)
-        # Schedule the async processing on the main loop
-        asyncio.run_coroutine_threadsafe(self.process_file_async(filepath), self.loop)
+        # The detector submits it once the writer is done
+        self.detector.touch_threadsafe(filepath)
+
+    def on_modified(self, event):
+        if event.is_directory or not self._wanted(Path(event.src_path)):
+            return
+        self.detector.touch_threadsafe(Path(event.src_path))
+
+    def on_closed(self, event):
+        # Only emitted where the OS reports close-after-write (inotify)
+        if event.is_directory or not self._wanted(Path(event.src_path)):
+            return
+        self.detector.touch_threadsafe(Path(event.src_path), complete=True)
+
+    def on_moved(self, event):
+        # A rename into the folder delivers a complete file (e.g. browser downloads)
+        filepath = Path(event.dest_path)
+        if event.is_directory or filepath.parent != INGEST_DIR or not self._wanted(filepath):
+            return
+        print(f"\n[DETECTED] New file: {filepath.name}", flush=True)
+        self.detector.touch_threadsafe(filepath, complete=True)
+
+    @staticmethod
+    def _inode(path: Path):
+        try:
+            return path.stat().st_ino
+        except FileNotFoundError:
+            return None
+
+    def _owns(self, job: dict, path: Path) -> bool:
+        """True when path is the file this job was opened for (renames keep the inode)."""
+        inode = self._inode(path)
+        return inode is not None and job.get('inode') in (None, inode)
+
+    @staticmethod
+    def source_name(path: Path) -> str:
+        """Original filename behind a .processing / .error name."""
+        if path.suffix in ('.processing', '.error'):
+            return path.stem
+        return path.name
+
+    def recover(self) -> list:
+        """
+        Finds work left over from a previous run: jobs that died mid-flight,
+        orphaned .processing files and files dropped while we were down.
+        Stray .error files are adopted into the retry schedule.
+        """
+        pending = []
+        for job in self.journal.incomplete():
+            processing_path = INGEST_DIR / (job['name'] + '.processing')
+            if self._owns(job, processing_path):
+                print(f"  > Recovering {job['name']} from stage '{job['stage']}'", flush=True)
+                pending.append(processing_path)
+            else:
+                self.journal.fail(job, "source file missing after restart")
+
+        for path in sorted(INGEST_DIR.iterdir()):
+            if not path.is_file() or path.name.startswith('.'):
+                continue
+            if path.suffix == '.processing':
+                if path not in pending:
+                    pending.append(path)
+            elif path.suffix == '.error':
+                inode = self._inode(path)
+                if self.journal.owner(path.stem, inode) is None:
+                    self.journal.register_error(path.stem, inode)
+            else:
+                pending.append(path)
+        return pending
+
+    async def retry_due(self):
+        """Re-queues .error files whose backoff has elapsed."""
+        for job in self.journal.due_retries():
+            error_path = INGEST_DIR / (job['name'] + '.error')
+            if self._owns(job, error_path):
+                print(f"\n[RETRY] {job['name']} (attempt {job['attempts'] + 1})", flush=True)
+                await self.scheduler.submit(error_path)
+            else:
+                # Removed by hand, or replaced by a newer file of the same name that failed too
+                if error_path.exists():
+                    print(f"  ! {job['name']}: parked file now belongs to a newer drop; dropping old job", flush=True)
+                self.journal.finish(job, job['stage'])
 
     async def process_file_async(self, filepath: Path):
+        # One trace per job: every span below (parser, analyzer, writer) joins it
+        with metrics.trace(self.source_name(filepath)), metrics.span("job"):
+            return await self._process_file_async(filepath)
+
+    async def _process_file_async(self, filepath: Path):
         # 0. Atomic Lock Strategy
-        processing_path = filepath.with_suffix(filepath.suffix + '.processing')
-        
+        name = self.source_name(filepath)
+        processing_path = filepath.with_name(name + '.processing')
+
         try:
             # Atomic rename serves as a lock
             # If this fails (e.g. file already gone), we just exit
             if not filepath.exists():
                 return
-            filepath.rename(processing_path)
+            if filepath != processing_path:
+                with metrics.span("lock"):
+                    filepath.rename(processing_path)
             print(f"  > Locked: {processing_path.name}", flush=True)
         except Exception:
             # File might have been grabbed by another event fire
             return
-            
+
+        # Only a .processing/.error file can belong to an earlier job; a fresh
+        # drop under a reused name is new content and starts its own job
+        resume = filepath.suffix in ('.processing', '.error')
+        job = self.journal.open_job(name, self._inode(processing_path), resume=resume)
+        if job['stage'] != 'locked':
+            print(f"  > Resuming from stage '{job['stage']}'", flush=True)
+
         print(f"  > Processing...", flush=True)
-        # Debounce/wait for write (though rename already happened)
-        await asyncio.sleep(0.5)
-        
+
         try:
+            await self.run_stages(job, name, processing_path)
+        except Exception as e:
+            print(f"  [ERROR] Failed to process {name}: {e}", flush=True)
+            job = self.journal.fail(job, str(e))
+            if job['status'] == 'error':
+                delay = int(job['next_retry_at'] - time.time())
+                print(f"  > Retry {job['attempts']} scheduled in {delay}s", flush=True)
+            else:
+                print(f"  ! Giving up on {name} after {job['attempts']} attempts", flush=True)
+                # A scraped URL keeps its claim while retries are pending; let a re-drop take it
+                if job.get('staging_dir'):
+                    incremental.release(job['staging_dir'])
+            # Park the file as .error until the retry picks it up
+            if processing_path.exists():
+                error_path = processing_path.with_suffix('.error')
+                processing_path.rename(error_path)
+            return False
+
+    async def run_stages(self, job: dict, name: str, processing_path: Path):
+        """Runs the pipeline from the job's last completed stage, journaling each one."""
+        content = None
+        staging_dir = Path(job['staging_dir']) if job.get('staging_dir') else None
+
+        if job['stage'] == 'locked':
+            # Multi-conversation exports fan out into one note per conversation
+            # (the batch progress log handles their resume)
+            if SPLIT_EXPORTS and await asyncio.to_thread(batch.is_multi_conversation_export, processing_path):
+                await self.process_export_async(name, processing_path)
+                self.journal.finish(job)
+                return
+
+            if job['updated_at'] < self.started_at:
+                # Died mid-scrape last run: drop the URL claim it left behind
+                await asyncio.to_thread(parser.release_url_claim, processing_path)
+
             # 1. Parse (Async) - NOTE: parser now reads the .processing file
-            content, staging_dir = await parser.parse_file_async(processing_path)
-            
-            if content is None:
+            async with self.scheduler.stage("scrape"):
+                with metrics.span("parse"):
+                    content, staging_dir = await parser.parse_file_async(processing_path, browser_pool=self.browser_pool)
+
+            if content is None or not content.strip():
                 # Likely deduplicated or empty
+                if content is not None:
+                    print("  ! Text extraction failed or empty.", flush=True)
                 processing_path.unlink(missing_ok=True)
+                self.journal.finish(job, 'skipped')
                 return
-                
-            if not content.strip():
-                print("  ! Text extraction failed or empty.", flush=True)
-                processing_path.unlink(missing_ok=True)
-                return
 
+            content_file = await asyncio.to_thread(self.journal.save_content, job, content)
+            self.journal.advance(job, 'parsed', content_file=content_file, staging_dir=staging_dir)
+
+        # A grown share link: only the appended messages are analyzed, into the existing note
+        update = await asyncio.to_thread(incremental.load_update, staging_dir)
+
+        if job['stage'] == 'parsed':
+            if content is None:
+                content = await asyncio.to_thread(self.journal.load_content, job)
             print("  > Analyzing with Gemini 3 (Flash)...", flush=True)
-            
+
             # 2. Analyze (Async)
-            analysis = await analyzer.analyze_content_async(content)
-            
-            # 3. Write
-            output_path = writer.write_note_sync(analysis, original_source=filepath.name, staging_dir=staging_dir)
-            print(f"  [SUCCESS] Note created: {output_path}", flush=True)
-
-            # 4. Archive (Move from .processing to archive)
-            archive_path = ARCHIVE_DIR / filepath.name
-            if archive_path.exists():
-                archive_path = ARCHIVE_DIR / f"{filepath.stem}_{int(time.time())}{filepath.suffix}"
-            
-            shutil.move(str(processing_path), str(archive_path))
-            print(f"  > Archived source file to {archive_path.name}", flush=True)
+            async with self.scheduler.stage("analyze"):
+                with metrics.span("analyze", chars=len(content), update=bool(update)):
+                    if update:
+                        analysis = await analyzer.analyze_update_async(content, update['summary'])
+                    else:
+                        analysis = await analyzer.analyze_content_async(content)
+            if update and analysis.get('topic') == analyzer.ERROR_TOPIC:
+                # Never append an error section to a good note; retry instead
+                raise RuntimeError(analysis.get('solution_insight'))
+            self.journal.advance(job, 'analyzed', analysis=analysis)
 
-        except Exception as e:
-            print(f"  [ERROR] Failed to process {filepath.name}: {e}", flush=True)
-            # Cleanup on failure so we don't leave .processing files behind if possible
-            if processing_path.exists():
-                # On error, maybe move to an 'error' folder or just leave it?
-                # For now let's just rename it back or to .error
-                error_path = processing_path.with_suffix('.error')
-                processing_path.rename(error_path)
+        async with self.scheduler.stage("write"):
+            if job['stage'] == 'analyzed':
+                # 3. Write
+                with metrics.span("write"):
+                    if update:
+                        output_path = await writer.update_note_async(
+                            update['note_path'], self.journal.load_analysis(job), staging_dir=staging_dir
+                        )
+                    else:
+                        output_path = await writer.write_note_async(
+                            self.journal.load_analysis(job), original_source=name, staging_dir=staging_dir
+                        )
+                print(f"  [SUCCESS] Note {'updated' if update else 'created'}: {output_path}", flush=True)
+                self.journal.advance(job, 'written', note_path=output_path)
+
+            if job['stage'] == 'written':
+                if staging_dir is not None:
+                    # The scraped page becomes the baseline for the next incremental update
+                    await asyncio.to_thread(incremental.commit, staging_dir, job['note_path'])
+                # 4. Archive (Move from .processing to archive)
+                self.archive(name, processing_path)
+                self.journal.finish(job)
+
+    async def process_export_async(self, name: str, processing_path: Path):
+        print(f"  > Splitting export into per-conversation notes...", flush=True)
+        summary = await batch.run_split_export(processing_path, source_name=name, stage=self.scheduler.stage)
+        print(
+            f"  [SUCCESS] Export split: {summary['written']} notes written, "
+            f"{summary['skipped']} skipped, {summary['failed']} failed",
+            flush=True,
+        )
+        if summary["failed"]:
+            # The retry resumes from the batch progress log
+            raise RuntimeError(f"{summary['failed']} conversations failed")
+        self.archive(name, processing_path)
+
+    def archive(self, name: str, processing_path: Path):
+        with metrics.span("archive"):
+            self._archive(name, processing_path)
+
+    def _archive(self, name: str, processing_path: Path):
+        source = Path(name)
+        archive_path = ARCHIVE_DIR / name
+        if archive_path.exists():
+            archive_path = ARCHIVE_DIR / f"{source.stem}_{int(time.time())}{source.suffix}"
+
+        shutil.move(str(processing_path), str(archive_path))
+        print(f"  > Archived source file to {archive_path.name}", flush=True)
+
+async def refresh_vault_index():
+    try:
+        stats = await asyncio.to_thread(get_vault_index().reindex)
+        print(f"Vault index: {stats['notes']} notes ({stats['indexed']} reindexed, {stats['removed']} removed)", flush=True)
+    except Exception as e:
+        print(f"  ! Vault index refresh failed: {e}", flush=True)
 
 async def main():
+    ensure_dirs()
     print(f"Starting Ingest Watcher (Atomic + Gemini 3)...", flush=True)
     print(f"Watching: {INGEST_DIR}")
     print(f"Output: {writer.VAULT_DIR}")
+    print(f"Concurrency: scrape={SCRAPE_CONCURRENCY} analyze={ANALYZE_CONCURRENCY} write={WRITE_CONCURRENCY}")
     print("Press Ctrl+C to stop.")
 
     loop = asyncio.get_running_loop()
-    event_handler = IngestHandler(loop)
+    # Build the client and resolve the Gemini model in the background,
+    # so startup stays instant and the first file doesn't pay for listing
+    model_warmup = loop.create_task(analyzer.warm_up())
+    # Catch the search index up with notes edited or removed while we were down
+    index_refresh = loop.create_task(refresh_vault_index())
+
+    # Per-job spans go to the JSON-lines log; counters/histograms to /metrics
+    analyzer.add_call_listener(metrics.record_llm_call)
+    metrics_server = None
+    if METRICS_PORT:
+        metrics_server = metrics.start_metrics_server(METRICS_HOST, METRICS_PORT)
+        if metrics_server is not None:
+            print(f"Metrics: http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+
+    scheduler = IngestScheduler(
+        loop,
+        limits={"scrape": SCRAPE_CONCURRENCY, "analyze": ANALYZE_CONCURRENCY, "write": WRITE_CONCURRENCY},
+        queue_size=INGEST_QUEUE_SIZE,
+    )
+    # Chromium is launched lazily on the first share link, then reused
+    browser_pool = BrowserPool()
+    event_handler = IngestHandler(loop, scheduler, browser_pool)
+    scheduler.start(event_handler.process_file_async)
+
     observer = Observer()
     observer.schedule(event_handler, str(INGEST_DIR), recursive=False)
     observer.start()
 
+    # Pick up anything left from a crash or dropped while we were down
+    leftovers = event_handler.recover()
+    if leftovers:
+        print(f"[RECOVERY] Queuing {len(leftovers)} file(s) from a previous run", flush=True)
+    detector_task = loop.create_task(event_handler.detector.run())
+    for path in leftovers:
+        if path.suffix == '.processing':
+            await scheduler.submit(path)
+        else:
+            # May still be mid-copy from before we started
+            event_handler.detector.touch(path)
+
     try:
+        last_report = time.monotonic()
+        was_busy = False
         while True:
             await asyncio.sleep(1)
+            await event_handler.retry_due()
+            busy = scheduler.is_busy() or bool(event_handler.detector.pending)
+            # Report periodically while draining, plus once when the queue empties
+            if (busy and time.monotonic() - last_report >= METRICS_REPORT_INTERVAL) or (was_busy and not busy):
+                scheduler.report(event_handler.detector)
+                last_report = time.monotonic()
+            was_busy = busy
     except asyncio.CancelledError:
         observer.stop()
-    
+        detector_task.cancel()
+        model_warmup.cancel()
+        index_refresh.cancel()
+        await scheduler.stop()
+        await browser_pool.close()
+        if metrics_server is not None:
+            metrics_server.shutdown()
+
     observer.join()
 
 if __name__ == "__main__":